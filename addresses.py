@@ -1,51 +1,456 @@
+import argparse
+import ipaddress
+import mmap
 import os
-import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.request import pathname2url
+
+from fileutils import atomic_path
+
+# files at least this large are scanned through mmap instead of buffered reads
+MMAP_THRESHOLD = 1 << 20
+
+
+@dataclass
+class InterfaceConfig:
+    """
+    An 'interface' block
+    """
+    name: str
+    ip: Optional[str] = None
+    mask: Optional[str] = None
+    vrf: Optional[str] = None
+    mpls: bool = False
+    shutdown: bool = False
+    secondary: list = field(default_factory=list) # (ip, mask) of 'ip address ... secondary' lines
+
+    @property
+    def prefixlen(self):
+        return ipaddress.IPv4Network(f"0.0.0.0/{self.mask}").prefixlen if self.mask else None
+
+
+@dataclass
+class VrfConfig:
+    """
+    An 'ip vrf' block
+    """
+    name: str
+    rd: Optional[str] = None
+    rt_export: list = field(default_factory=list)
+    rt_import: list = field(default_factory=list)
+
+
+@dataclass
+class OspfNetwork:
+    """
+    A 'network <address> <wildcard> area <area>' statement
+    """
+    address: str
+    wildcard: str
+    area: str
+
+    def covers(self, ip):
+        """
+        True if the statement enables OSPF on an interface with this address
+        """
+        wildcard = int(ipaddress.IPv4Address(self.wildcard))
+        return int(ipaddress.IPv4Address(ip)) & ~wildcard == int(ipaddress.IPv4Address(self.address)) & ~wildcard
+
+
+@dataclass
+class OspfConfig:
+    """
+    A 'router ospf' block
+    """
+    process_id: str
+    networks: list = field(default_factory=list)
+
+
+@dataclass
+class BgpNeighbor:
+    """
+    Settings of one BGP neighbor, either global or inside an address family
+    """
+    ip: str
+    remote_as: Optional[str] = None
+    update_source: Optional[str] = None
+    activate: bool = False
+    send_community: Optional[str] = None
+    route_reflector_client: bool = False
+    as_override: bool = False
+    allowas_in: bool = False
+
+
+@dataclass
+class BgpAddressFamily:
+    """
+    An 'address-family' block of a 'router bgp' block ('ipv4', 'vpnv4', 'ipv4 vrf X'...)
+    """
+    afi: str
+    vrf: Optional[str] = None
+    neighbors: dict = field(default_factory=dict)
+    networks: list = field(default_factory=list) # (address, mask) of 'network' statements
+    redistribute: list = field(default_factory=list)
+
+
+@dataclass
+class BgpConfig:
+    """
+    A 'router bgp' block
+    """
+    asn: str
+    cluster_id: Optional[str] = None
+    neighbors: dict = field(default_factory=dict)
+    address_families: dict = field(default_factory=dict) # 'vpnv4', 'ipv4', 'ipv4 vrf X' -> BgpAddressFamily
+
+
+@dataclass
+class RouterConfig:
+    """
+    Structured view of a router config
+    """
+    router: str
+    hostname: Optional[str] = None
+    interfaces: dict = field(default_factory=dict)
+    vrfs: dict = field(default_factory=dict)
+    ospf: dict = field(default_factory=dict) # process id -> OspfConfig
+    bgp: Optional[BgpConfig] = None
+    global_lines: list = field(default_factory=list)
+
+
+def _neighbor(neighbors, ip):
+    if ip not in neighbors:
+        neighbors[ip] = BgpNeighbor(ip)
+    return neighbors[ip]
+
+
+def _parse_bgp_line(bgp, family, words):
+    """
+    Apply one statement of a 'router bgp' block (or of one of its address families)
+    """
+    if words[0] == 'bgp' and len(words) >= 3 and words[1] == 'cluster-id':
+        bgp.cluster_id = words[2]
+    elif words[0] == 'neighbor' and len(words) >= 3:
+        neighbors = family.neighbors if family is not None else bgp.neighbors
+        neighbor = _neighbor(neighbors, words[1])
+        option = words[2]
+        if option == 'remote-as' and len(words) >= 4:
+            neighbor.remote_as = words[3]
+        elif option == 'update-source' and len(words) >= 4:
+            neighbor.update_source = words[3]
+        elif option == 'activate':
+            neighbor.activate = True
+        elif option == 'send-community':
+            neighbor.send_community = words[3] if len(words) >= 4 else 'standard'
+        elif option == 'route-reflector-client':
+            neighbor.route_reflector_client = True
+        elif option == 'as-override':
+            neighbor.as_override = True
+        elif option == 'allowas-in':
+            neighbor.allowas_in = True
+    elif family is not None and words[0] == 'network' and len(words) >= 2:
+        mask = words[3] if len(words) >= 4 and words[2] == 'mask' else None
+        family.networks.append((words[1], mask))
+    elif family is not None and words[0] == 'redistribute' and len(words) >= 2:
+        family.redistribute.append(' '.join(words[1:]))
+
+
+def parse_config_lines(lines, router):
+    """
+    Parse the lines of a router config into a RouterConfig.
+
+    Blocks start at non-indented lines ('interface', 'ip vrf', 'router ospf',
+    'router bgp'); '!' lines are comments and do not close a block, so the
+    address families of a 'router bgp' block are attached to it.
+    """
+    config = RouterConfig(router)
+    block = None  # current top-level record
+    family = None # current BGP address family
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        words = line.split()
+        if not words or words[0].startswith('!'):
+            continue
+        if not line[0].isspace():
+            family = None
+            keyword = words[0]
+            if keyword == 'interface' and len(words) >= 2:
+                block = config.interfaces.setdefault(words[1], InterfaceConfig(words[1]))
+            elif keyword == 'ip' and len(words) >= 3 and words[1] == 'vrf':
+                block = config.vrfs.setdefault(words[2], VrfConfig(words[2]))
+            elif keyword == 'router' and len(words) >= 3 and words[1] == 'ospf':
+                block = config.ospf.setdefault(words[2], OspfConfig(words[2]))
+            elif keyword == 'router' and len(words) >= 3 and words[1] == 'bgp':
+                block = config.bgp = BgpConfig(words[2])
+            else:
+                block = None
+                if keyword == 'hostname' and len(words) >= 2:
+                    config.hostname = words[1]
+                config.global_lines.append(line)
+            continue
+
+        if isinstance(block, InterfaceConfig):
+            if words[:2] == ['ip', 'address'] and len(words) >= 4:
+                if words[-1] == 'secondary':
+                    block.secondary.append((words[2], words[3]))
+                else:
+                    block.ip, block.mask = words[2], words[3]
+            elif words[:3] == ['ip', 'vrf', 'forwarding'] and len(words) >= 4:
+                block.vrf = words[3]
+            elif words == ['mpls', 'ip']:
+                block.mpls = True
+            elif words == ['shutdown']:
+                block.shutdown = True
+            elif words == ['no', 'shutdown']:
+                block.shutdown = False
+        elif isinstance(block, VrfConfig):
+            if words[0] == 'rd' and len(words) >= 2:
+                block.rd = words[1]
+            elif words[0] == 'route-target' and len(words) >= 3:
+                if words[1] in ('export', 'both'):
+                    block.rt_export.append(words[2])
+                if words[1] in ('import', 'both'):
+                    block.rt_import.append(words[2])
+        elif isinstance(block, OspfConfig):
+            if words[0] == 'network' and len(words) >= 5 and words[3] == 'area':
+                block.networks.append(OspfNetwork(words[1], words[2], words[4]))
+        elif isinstance(block, BgpConfig):
+            if words[0] == 'address-family' and len(words) >= 2:
+                vrf = words[3] if len(words) >= 4 and words[2] == 'vrf' else None
+                key = ' '.join(words[1:])
+                family = block.address_families.setdefault(key, BgpAddressFamily(words[1], vrf))
+            elif words[0] == 'exit-address-family':
+                family = None
+            else:
+                _parse_bgp_line(block, family, words)
+    return config
+
+
+def parse_router_config(file_path, router=None):
+    """
+    Parse a router config file into a RouterConfig
+
+    Args:
+        file_path (str): path of a '<router>_startup-config.cfg' file
+        router (str, optional): router name, taken from the file name by default
+    """
+    if router is None:
+        router = os.path.basename(file_path).split('_')[0]
+    size = os.path.getsize(file_path)
+    if size and size >= MMAP_THRESHOLD:
+        return parse_config_lines(_mmap_lines(file_path), router)
+    with open(file_path, 'r') as f:
+        return parse_config_lines(f, router)
+
+
+def _mmap_lines(file_path):
+    """
+    Yield the lines of a large file through a read-only memory map
+    """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b""):
+            yield line.decode()
+
+
+def format_address(intf):
+    """
+    Format the address of an interface as "<ip> <mask>", or "no IP" if it has none
+    """
+    return f"{intf.ip} {intf.mask}" if intf.ip else "no IP"
+
 
 def parse_config(file_path):
     """
     Parse a router config file and return a dictionary of interfaces and their IP addresses.
     """
-    interfaces = {}
-    current_interface = None
-    with open(file_path, 'r') as f:
-        for line in f:
-            line = line.strip()
-            # Check for interface definition
-            if line.startswith('interface'):
-                current_interface = line.split()[1]  # Extract interface name (e.g., GigabitEthernet0/0)
-                interfaces[current_interface] = "no IP"  # Default to "no IP" if no address is found
-            # Check for IP address within the current interface block
-            elif line.startswith('ip address') and current_interface:
-                parts = line.split()
-                if len(parts) >= 3:  # Ensure there are enough parts (ip address <ip> <mask>)
-                    ip = parts[2]    # IP address
-                    mask = parts[3]  # Subnet mask
-                    interfaces[current_interface] = f"{ip} {mask}"
-    return interfaces
-
-def get_address_file():
+    interfaces = parse_router_config(file_path).interfaces
+    return {name: format_address(intf) for name, intf in interfaces.items()}
+
+
+def _parse_entry(item):
+    router_name, file_path = item
+    return parse_router_config(file_path, router_name)
+
+
+def load_configs(configs_dir='configs', jobs=1):
     """
-    Main function to process all config files and write the interface summary.
+    Parse every '*_startup-config.cfg' file of a directory
+
+    Args:
+        configs_dir (str): directory holding the configs
+        jobs (int): number of worker processes; files are spread over a process pool when > 1
+
+    Returns:
+        dict: router name -> RouterConfig
+    """
+    items = []
+    with os.scandir(configs_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('_startup-config.cfg') and entry.is_file():
+                router_name = entry.name.split('_')[0]  # Extract router name from filename (e.g., R1)
+                items.append((router_name, entry.path))
+    if jobs <= 1 or len(items) <= 1:
+        parsed = map(_parse_entry, items)
+        return {router: config for (router, _), config in zip(items, parsed)}
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parsed = pool.map(_parse_entry, items, chunksize=chunksize)
+        return {router: config for (router, _), config in zip(items, parsed)}
+
+
+class AddressIndex:
+    """
+    Reverse index from IP address to (router, interface), for O(1) lookups
+    """
+    def __init__(self, configs):
+        self.by_ip = {}
+        for router, config in configs.items():
+            for name, intf in config.interfaces.items():
+                for ip in [intf.ip] + [ip for ip, _ in intf.secondary]:
+                    if ip:
+                        self.by_ip[ip] = (router, name)
+
+    def lookup(self, ip):
+        """
+        Return (router, interface) owning an IP, or None
+        """
+        return self.by_ip.get(str(ip))
+
+    def __contains__(self, ip):
+        return str(ip) in self.by_ip
+
+    def __len__(self):
+        return len(self.by_ip)
+
+
+def write_summary_db(all_configs, db_file='interface_summary.db'):
+    """
+    Write the interface summary as an SQLite table, one row per interface.
+
+    The 'interfaces' table holds router, interface, ip, prefixlen and vrf
+    (ip and prefixlen are NULL for interfaces without an address) and is
+    indexed on router and on ip. The file is replaced atomically.
+    """
+    with atomic_path(db_file) as tmp_file:
+        conn = sqlite3.connect(tmp_file)
+        try:
+            conn.execute(
+                "CREATE TABLE interfaces ("
+                "router TEXT NOT NULL, interface TEXT NOT NULL, ip TEXT, prefixlen INTEGER, vrf TEXT, "
+                "PRIMARY KEY (router, interface))"
+            )
+            conn.executemany(
+                "INSERT INTO interfaces VALUES (?, ?, ?, ?, ?)",
+                (
+                    (router, name, intf.ip, intf.prefixlen, intf.vrf)
+                    for router in sorted(all_configs)
+                    for name, intf in sorted(all_configs[router].interfaces.items())
+                )
+            )
+            conn.execute("CREATE INDEX interfaces_ip ON interfaces (ip)")
+            conn.commit()
+        finally:
+            conn.close()
+    return db_file
+
+
+def open_summary_db(db_file):
+    """
+    Open the interface summary table read-only.
+
+    sqlite3.connect() would create a missing file as an empty database, which
+    then fails with 'no such table' and passes every later existence check.
+
+    Raises:
+        FileNotFoundError: if db_file does not exist
     """
-    configs_dir = 'configs'
-    all_configs = {}
+    if not os.path.isfile(db_file):
+        raise FileNotFoundError(f"Interface summary file '{db_file}' not found.")
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro", uri=True)
 
-    # Iterate through files in the configs directory
-    for file in os.listdir(configs_dir):
-        if file.endswith('_startup-config.cfg'):
-            router_name = file.split('_')[0]  # Extract router name from filename (e.g., R1)
-            file_path = os.path.join(configs_dir, file)
-            interfaces = parse_config(file_path)
-            all_configs[router_name] = interfaces
+
+def load_summary_db(db_file='interface_summary.db', router=None):
+    """
+    Load the rows of the interface summary table
+
+    Args:
+        db_file (str): SQLite file written by write_summary_db
+        router (str, optional): only return the interfaces of this router
+
+    Returns:
+        list: dicts with router, interface, ip, prefixlen and vrf keys
+    """
+    conn = open_summary_db(db_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        if router is None:
+            rows = conn.execute("SELECT * FROM interfaces ORDER BY router, interface")
+        else:
+            rows = conn.execute("SELECT * FROM interfaces WHERE router = ? ORDER BY interface", (router,))
+        return [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def lookup_ip(db_file, ip):
+    """
+    Return (router, interface) owning an IP in the interface summary table, or None
+    """
+    conn = open_summary_db(db_file)
+    try:
+        return conn.execute("SELECT router, interface FROM interfaces WHERE ip = ?", (str(ip),)).fetchone()
+    finally:
+        conn.close()
+
+
+def get_address_file(configs_dir='configs', output_file='interface_summary.txt', jobs=1,
+                     db_file='interface_summary.db'):
+    """
+    Main function to process all config files and write the interface summary.
+
+    Args:
+        configs_dir (str): directory holding the '*_startup-config.cfg' files
+        output_file (str): path of the summary to write
+        jobs (int): number of worker processes used to parse the configs
+        db_file (str, optional): also write the summary to this SQLite file (None to skip)
+
+    Returns:
+        dict: router name -> RouterConfig, so callers can index the parsed configs
+    """
+    all_configs = load_configs(configs_dir, jobs=jobs)
 
     # Write the results to interface_summary.txt
-    with open('interface_summary.txt', 'w') as f:
+    with open(output_file, 'w') as f:
         for router in sorted(all_configs.keys()):  # Sort routers alphabetically
             f.write(f"Router: {router}\n")
-            for interface in sorted(all_configs[router].keys()):  # Sort interfaces alphabetically
-                ip = all_configs[router][interface]
+            interfaces = all_configs[router].interfaces
+            for interface in sorted(interfaces.keys()):  # Sort interfaces alphabetically
+                ip = format_address(interfaces[interface])
                 f.write(f"  Interface: {interface}, IP: {ip}\n")
             f.write("\n")  # Add a blank line between routers
+    if db_file:
+        write_summary_db(all_configs, db_file)
+    return all_configs
+
+
+def main(argv=None):
+    """
+    Write interface_summary.txt from the configs directory
+    """
+    parser = argparse.ArgumentParser(description="Summarise the interfaces and addresses of router configs")
+    parser.add_argument("--configs", default="configs", help="directory holding the router configs")
+    parser.add_argument("--output", default="interface_summary.txt", help="summary file to write")
+    parser.add_argument("--db", default="interface_summary.db",
+                        help="SQLite copy of the summary, indexed on router and IP ('' to skip)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes used to parse the configs (default: 1)")
+    args = parser.parse_args(argv)
+    configs = get_address_file(args.configs, args.output, jobs=args.jobs, db_file=args.db)
+    print(f"Summarised {len(configs)} router configs in '{args.output}'")
 
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from synth_intent import scaled_intent
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+# routers of the synthetic IPv6 intent the renderers are checked on (40 PEs, so 2 route reflectors)
+RENDERER_CHECK_ROUTERS = 200
+
+
+def measure(func, memory=True):
+    """
+    Time a stage, then run it again under tracemalloc to get its peak memory
+
+    tracemalloc slows allocations down a lot, so the timing comes from a run
+    without it.
+
+    Returns:
+        tuple: (result of the timed run, {'seconds': ..., 'peak_bytes': ...})
+    """
+    start = time.perf_counter()
+    result = func()
+    stats = {'seconds': round(time.perf_counter() - start, 6)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+
+def allocator_lookups(model, allocator):
+    """
+    Call every IPAllocator getter the renderer uses, once per router
+
+    Returns:
+        int: number of calls
+    """
+    calls = 0
+    for router in model.sp_routers:
+        allocator.get_sp_loopback_ip(router)
+        calls += 1
+        for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+            allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+            calls += 1
+        if allocator.has_ipv6:
+            allocator.get_sp_loopback_ip_v6(router)
+            calls += 1
+            for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+                allocator.get_link_subnet_v6(router, local_intf, peer_router, peer_intf)
+                calls += 1
+    for router in model.ce_routers:
+        allocator.get_ce_loopback_ip(router)
+        allocator.get_peer_subnet(router)
+        calls += 2
+    return calls
+
+
+def renderer_mismatches(intent):
+    """
+    Routers whose config differs between the compiled templates and the
+    hand-written f-string sections
+
+    Returns:
+        list: routers in generation order; empty when both renderers agree byte for byte
+    """
+    from create_config import IPAllocator, allocate_addresses, generate_config
+    from intent_model import compile_intent
+
+    model = compile_intent(intent)
+    allocator = IPAllocator(model)
+    allocate_addresses(model, allocator)
+    return [
+        router for router in model.all_routers
+        if generate_config(router, model, allocator, model.is_ce(router), 'template')
+        != generate_config(router, model, allocator, model.is_ce(router), 'fstring')
+    ]
+
+
+def check_renderers(intent_file="intent.json"):
+    """
+    Check that both renderers give the same configs for the intent file and
+    for a synthetic IPv6 intent with route reflectors
+
+    Raises:
+        ValueError: if a config differs
+    """
+    intents = {}
+    if os.path.exists(intent_file):
+        with open(intent_file) as f:
+            intents[intent_file] = json.load(f)
+    intents['synthetic IPv6 route-reflector intent'] = scaled_intent(RENDERER_CHECK_ROUTERS, ipv6=True)
+    for name, intent in intents.items():
+        mismatches = renderer_mismatches(intent)
+        if mismatches:
+            raise ValueError(f"{name}: the template and fstring renderers differ for "
+                             f"{len(mismatches)} router(s): {', '.join(mismatches[:10])}")
+        print(f"Renderers agree on {name}")
+
+
+def benchmark_size(routers, workdir, jobs=1, memory=True, graph=True, **intent_options):
+    """
+    Run every stage of the pipeline on a synthetic intent of about `routers` routers
+
+    Returns:
+        dict: size of the intent and {stage: stats}
+    """
+    from create_config import IPAllocator, allocate_addresses, generate_config, render_configs
+    from intent_model import compile_intent
+    from validate import validate_intent
+    from addresses import get_address_file
+
+    intent = scaled_intent(routers, **intent_options)
+    intent_file = os.path.join(workdir, 'intent.json')
+    with open(intent_file, 'w') as f:
+        json.dump(intent, f)
+    configs_dir = os.path.join(workdir, 'configs')
+    summary_file = os.path.join(workdir, 'interface_summary.txt')
+    db_file = os.path.join(workdir, 'interface_summary.db')
+    stages = {}
+
+    errors, stages['validate'] = measure(lambda: validate_intent(intent), memory)
+    if errors:
+        raise ValueError(f"synthetic intent of {routers} routers is invalid: {errors[0]}")
+    model, stages['compile_intent'] = measure(lambda: compile_intent(intent), memory)
+
+    def allocate():
+        allocator = IPAllocator(model)
+        allocate_addresses(model, allocator)
+        return allocator
+    allocator, stages['allocate'] = measure(allocate, memory)
+    calls, stages['allocator_lookups'] = measure(lambda: allocator_lookups(model, allocator), memory)
+    stages['allocator_lookups']['calls'] = calls
+
+    def generate(renderer):
+        return [generate_config(router, model, allocator, model.is_ce(router), renderer)
+                for router in model.all_routers]
+    # compiled templates (the default renderer) against the hand-written f-string sections
+    configs, stages['generate_config'] = measure(lambda: generate('template'), memory)
+    stages['generate_config']['bytes'] = sum(map(len, configs))
+    fstring_configs, stages['generate_config_fstring'] = measure(lambda: generate('fstring'), memory)
+    stages['generate_config_fstring']['bytes'] = sum(map(len, fstring_configs))
+    if configs != fstring_configs:
+        raise ValueError(f"synthetic intent of {routers} routers: the template and fstring renderers differ")
+    del configs, fstring_configs
+
+    os.makedirs(configs_dir, exist_ok=True)
+    _, stages['render_configs'] = measure(
+        lambda: render_configs(model, allocator, model.all_routers, configs_dir, jobs=jobs), memory)
+
+    def summarize():
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        return get_address_file(configs_dir, summary_file, jobs=jobs, db_file=db_file)
+    _, stages['get_address_file'] = measure(summarize, memory)
+
+    if graph:
+        from create_graph import run_network_visualization
+
+        def visualize():
+            # the visualization prints every loopback, keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                return run_network_visualization(intent_file, db_file, os.path.join(workdir, 'topology.png'),
+                                                 headless=True, cache_dir=None)
+        _, stages['run_network_visualization'] = measure(visualize, memory)
+
+    sp = intent['network']['service_provider']
+    return {
+        'routers': len(model.all_routers),
+        'pe': len(model.pe_routers),
+        'p': len(model.p_routers),
+        'ce': len(model.ce_routers),
+        'core_links': len(sp['links']) - len(model.ce_routers),
+        'stages': stages,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    Print the time ratio (current / previous) of every stage found in both result files
+    """
+    old = {result['routers']: result['stages'] for result in previous['results']}
+    for result in current['results']:
+        stages = old.get(result['routers'])
+        if stages is None:
+            continue
+        for stage, stats in result['stages'].items():
+            if stage in stages and stages[stage]['seconds'] > 0:
+                ratio = stats['seconds'] / stages[stage]['seconds']
+                print(f"{result['routers']:>6} {stage:<26} {stages[stage]['seconds']:>10.4f}s -> "
+                      f"{stats['seconds']:>10.4f}s  x{ratio:.2f}")
+
+
+def main(argv=None):
+    """
+    Benchmark the pipeline on synthetic intents and write the results as JSON
+    """
+    parser = argparse.ArgumentParser(description="Benchmark config generation, parsing and graphing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="router counts to benchmark")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="worker processes for rendering and parsing")
+    parser.add_argument("--vrfs-per-customer", type=int, default=1, help="VRFs of each synthetic customer")
+    parser.add_argument("--link-density", type=float, default=3.0, help="average core degree of the P routers")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--no-graph", action="store_true", help="skip run_network_visualization")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file to write")
+    parser.add_argument("--compare", help="previous results file to compare with")
+    parser.add_argument("--intent", default="intent.json", help="intent file the renderers are checked on")
+    parser.add_argument("--check-renderers", action="store_true",
+                        help="only check that both renderers give the same configs, then exit")
+    args = parser.parse_args(argv)
+
+    # the f-string sections are the reference the templates must keep matching
+    check_renderers(args.intent)
+    if args.check_renderers:
+        return
+
+    results = []
+    for routers in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            result = benchmark_size(routers, workdir, jobs=args.jobs, memory=not args.no_memory,
+                                    graph=not args.no_graph, vrfs_per_customer=args.vrfs_per_customer,
+                                    link_density=args.link_density)
+        results.append(result)
+        print(f"{result['routers']} routers ({result['pe']} PE, {result['p']} P, {result['ce']} CE)")
+        for stage, stats in result['stages'].items():
+            peak = f"  peak {stats['peak_bytes'] / 1e6:9.2f} MB" if 'peak_bytes' in stats else ""
+            print(f"  {stage:<26} {stats['seconds']:>10.4f}s{peak}")
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'jobs': args.jobs,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from config_diff import GLOBAL, config_files, deployed_files, diff_sections, read_sections
+
+# statements whose new value replaces the old one, so the old one needs no 'no' form
+OVERRIDE_PREFIXES = ('hostname ', 'ip address ', 'bgp cluster-id ', 'description ', 'router-id ')
+# interfaces that can be deleted; physical interfaces are reset with 'default interface'
+LOGICAL_INTERFACES = ('Loopback', 'Tunnel', 'Vlan', 'Port-channel', 'BVI', 'Dialer', 'Virtual-Template')
+# routing processes handled like 'router ospf' blocks
+OSPF_PROCESSES = ('router ospf ', 'ipv6 router ospf ')
+
+
+def negate(statement):
+    """
+    'no' form of a statement ('no X' becomes 'X')
+    """
+    return statement[3:] if statement.startswith('no ') else f"no {statement}"
+
+
+def override_key(statement):
+    """
+    Part of a statement that identifies the setting it overrides, or None if
+    several statements with the same prefix can coexist
+    """
+    words = statement.split()
+    if statement.startswith('ip address ') and words[-1] != 'secondary':
+        return 'ip address'
+    if statement.startswith(OVERRIDE_PREFIXES):
+        return words[0] if words[0] != 'bgp' else 'bgp cluster-id'
+    if words[0] == 'neighbor' and len(words) >= 4 and words[2] == 'remote-as':
+        return f"neighbor {words[1]} remote-as"
+    return None
+
+
+def statement_changes(added, removed, skip=()):
+    """
+    Ordered commands that turn the removed statements into the added ones:
+    'no' forms first, then the new statements.
+
+    Removed statements overridden by an added one with the same override key
+    are left out, and so are those starting with a prefix of `skip` (settings
+    already deleted with their parent, e.g. the options of a removed neighbor).
+    """
+    replaced = {override_key(s) for s in added} - {None}
+    commands = [
+        negate(s) for s in removed
+        if override_key(s) not in replaced and not s.startswith(tuple(skip))
+    ]
+    return commands + list(added)
+
+
+def _removed_neighbors(removed, added):
+    """
+    Prefixes 'neighbor <ip> ' of the BGP neighbors whose remote-as is removed and not replaced
+    """
+    kept = {override_key(s) for s in added}
+    return [
+        f"neighbor {s.split()[1]} " for s in removed
+        if override_key(s) and override_key(s).endswith('remote-as') and override_key(s) not in kept
+    ]
+
+
+def interface_commands(key, diff, new):
+    """
+    Commands of an added or changed interface.
+
+    Changing 'ip vrf forwarding' clears the addresses of the interface, so the
+    VRF line comes first and every address of the new config is set again after it.
+    """
+    if key in diff.added:
+        return list(diff.added[key])
+    added, removed = diff.changed[key]
+    vrf_change = [s for s in removed + added if s.startswith('ip vrf forwarding ')]
+    if not vrf_change:
+        return statement_changes(added, removed)
+    vrf_lines = [s for s in added if s.startswith('ip vrf forwarding ')]
+    if not vrf_lines:
+        vrf_lines = [negate(s) for s in removed if s.startswith('ip vrf forwarding ')]
+    addresses = [s for s in new[key] if s.startswith('ip address ')]
+    others = statement_changes(
+        [s for s in added if not s.startswith(('ip vrf forwarding ', 'ip address '))],
+        [s for s in removed if not s.startswith(('ip vrf forwarding ', 'ip address '))],
+    )
+    return vrf_lines + addresses + others
+
+
+def _block(header, commands):
+    return [header] + [f" {command}" for command in commands] if commands else []
+
+
+def router_delta(old, new):
+    """
+    Ordered CLI commands that move a running router from the old config to the new one
+
+    Args:
+        old (dict): sections of the running config (None for an empty router)
+        new (dict): sections of the new config (None if the router is removed)
+
+    Returns:
+        list: config-mode lines, without 'configure terminal' / 'end'; empty if nothing changes
+    """
+    if new is None:
+        return []
+    old = old or {GLOBAL: []}
+    diff = diff_sections(None, old, new)
+    if not diff.needs_push:
+        return []
+
+    def keys(kind, source):
+        return [key for key in source if key and key[0].startswith(kind)]
+
+    def touched(kind):
+        return [key for key in new if key and key[0].startswith(kind) and (key in diff.added or key in diff.changed)]
+
+    lines = []
+    # 1. global statements
+    if GLOBAL in diff.changed:
+        lines += statement_changes(*diff.changed[GLOBAL])
+
+    # 2. new and changed VRFs, before the interfaces and address families that use them
+    for key in touched('ip vrf '):
+        commands = diff.added[key] if key in diff.added else statement_changes(*diff.changed[key])
+        lines += _block(key[0], commands)
+
+    # 3. interfaces
+    for key in touched('interface '):
+        lines += _block(key[0], interface_commands(key, diff, new))
+    for key in keys('interface ', diff.removed):
+        name = key[0].split(None, 1)[1]
+        lines.append(f"no {key[0]}" if name.startswith(LOGICAL_INTERFACES) else f"default {key[0]}")
+
+    # 4. OSPF and OSPFv3
+    for key in keys(OSPF_PROCESSES, diff.removed):
+        lines.append(f"no {key[0]}")
+    for key in touched(OSPF_PROCESSES):
+        commands = diff.added[key] if key in diff.added else statement_changes(*diff.changed[key])
+        lines += _block(key[0], commands)
+
+    # 5. BGP: a removed process goes first (there can only be one), then the
+    #    neighbors of the process and finally its address families
+    for key in keys('router bgp ', diff.removed):
+        if len(key) == 1:
+            lines.append(f"no {key[0]}")
+    for process in [key for key in new if len(key) == 1 and key[0].startswith('router bgp ')]:
+        header = process[0]
+        skip = []
+        commands = []
+        if process in diff.added:
+            commands += diff.added[process]
+        elif process in diff.changed:
+            added, removed = diff.changed[process]
+            # 'no neighbor <ip>' deletes every setting of the neighbor at once
+            skip = _removed_neighbors(removed, added)
+            commands += [f"no {prefix.strip()}" for prefix in skip]
+            commands += statement_changes(added, removed, skip=skip)
+        families = [key for key in new if len(key) == 2 and key[0] == header]
+        for key in diff.removed:
+            if len(key) == 2 and key[0] == header:
+                commands.append(f"no {key[1]}")
+        for key in families:
+            if key in diff.added:
+                family_commands = diff.added[key]
+            elif key in diff.changed:
+                added, removed = diff.changed[key]
+                # neighbors declared inside the family (PE-CE sessions of a VRF)
+                # are deleted the same way, with every setting under them
+                family_skip = [prefix for prefix in _removed_neighbors(removed, added) if prefix not in skip]
+                family_commands = [f"no {prefix.strip()}" for prefix in family_skip]
+                family_commands += statement_changes(added, removed, skip=skip + family_skip)
+            else:
+                continue
+            if not family_commands: # only settings of neighbors deleted above
+                continue
+            commands += [key[1]] + [f" {command}" for command in family_commands] + ["exit-address-family"]
+        lines += _block(header, commands)
+
+    # 6. removed VRFs, once no interface or address family uses them
+    for key in keys('ip vrf ', diff.removed):
+        lines.append(f"no {key[0]}")
+    return lines
+
+
+def delta_files(router, old_file, new_file):
+    return router, router_delta(read_sections(old_file), read_sections(new_file))
+
+
+def _delta_entry(item):
+    return delta_files(*item)
+
+
+def compute_deltas(old_files, new_files, jobs=1):
+    """
+    Compute the delta of every router of the new configs
+
+    Args:
+        old_files (dict): router -> running/previous config file
+        new_files (dict): router -> new config file
+        jobs (int): number of worker processes; routers are spread over a process pool when > 1
+
+    Returns:
+        dict: router -> commands, for the routers whose config changes
+    """
+    items = [(router, old_files.get(router), new_files[router]) for router in sorted(new_files)]
+    if jobs <= 1 or len(items) <= 1:
+        results = map(_delta_entry, items)
+        return {router: commands for router, commands in results if commands}
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return {router: commands for router, commands in pool.map(_delta_entry, items, chunksize=chunksize) if commands}
+
+
+def main(argv=None):
+    """
+    Write the CLI delta of every router whose config changed
+    """
+    parser = argparse.ArgumentParser(description="Generate the CLI commands that turn running configs into new ones")
+    parser.add_argument("old", help="directory of the running/previous configs, or a GNS3 .gns3 project")
+    parser.add_argument("new", nargs="?", default="configs", help="directory of the new configs (default: configs)")
+    parser.add_argument("--output", default="deltas", help="directory of the '<router>_delta.cfg' files")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes used to compute the deltas (default: 1)")
+    args = parser.parse_args(argv)
+
+    new_files = config_files(args.new)
+    deltas = compute_deltas(deployed_files(args.old, new_files), new_files, jobs=args.jobs)
+    os.makedirs(args.output, exist_ok=True)
+    for router, commands in deltas.items():
+        with open(os.path.join(args.output, f"{router}_delta.cfg"), 'w') as f:
+            f.write("\n".join(["configure terminal"] + commands + ["end"]) + "\n")
+        print(f"{router}: {len(commands)} line(s)")
+    print(f"Wrote {len(deltas)} delta(s) to '{args.output}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+# top-level blocks that are kept even when they have no statements
+BLOCK_KEYWORDS = ('interface ', 'ip vrf ', 'router ', 'ipv6 router ')
+# section key of the top-level statements that are not part of a block
+GLOBAL = ()
+
+
+def parse_sections(lines):
+    """
+    Split the lines of a router config into sections matched by key.
+
+    The key of a block is the tuple of its headers: ('interface GigabitEthernet1/0',),
+    ('ip vrf Customer1',), ('router ospf 1',), ('router bgp 65000',) and, for the
+    address families of a BGP block, ('router bgp 65000', 'address-family vpnv4').
+    Top-level statements outside any block go to the GLOBAL section.
+
+    Returns:
+        dict: section key -> list of statements (stripped, in config order)
+    """
+    sections = {GLOBAL: []}
+    block = None  # key of the current top-level block
+    family = None # key of the current BGP address family
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        text = line.strip()
+        if not text or text.startswith('!'):
+            continue
+        if not line[0].isspace():
+            family = None
+            if text.startswith(BLOCK_KEYWORDS):
+                block = (text,)
+                sections.setdefault(block, [])
+            else:
+                # a header only becomes a block if indented statements follow it
+                block = None
+                sections[GLOBAL].append(text)
+            continue
+        if block is None:
+            if not sections[GLOBAL]:
+                continue
+            header = sections[GLOBAL].pop()
+            block = (header,)
+            sections.setdefault(block, [])
+        if text.startswith('address-family ') and block[0].startswith('router bgp '):
+            family = block + (text,)
+            sections.setdefault(family, [])
+        elif text == 'exit-address-family':
+            family = None
+        else:
+            sections[family or block].append(text)
+    return sections
+
+
+def read_sections(file_path):
+    """
+    Parse a config file into sections, or return None if the file does not exist
+    """
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    with open(file_path) as f:
+        return parse_sections(f)
+
+
+@dataclass
+class RouterDiff:
+    """
+    Section-by-section differences between the old and new config of a router
+    """
+    router: str
+    added: dict = field(default_factory=dict)   # key -> statements of the sections only in the new config
+    removed: dict = field(default_factory=dict) # key -> statements of the sections only in the old config
+    changed: dict = field(default_factory=dict) # key -> (added statements, removed statements)
+
+    @property
+    def needs_push(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def to_dict(self):
+        name = section_name
+        return {
+            'router': self.router,
+            'needs_push': self.needs_push,
+            'added': {name(key): statements for key, statements in self.added.items()},
+            'removed': {name(key): statements for key, statements in self.removed.items()},
+            'changed': {
+                name(key): {'added': added, 'removed': removed}
+                for key, (added, removed) in self.changed.items()
+            },
+        }
+
+
+def section_name(key):
+    return ' / '.join(key) if key else 'global'
+
+
+def diff_sections(router, old, new):
+    """
+    Compare two section maps of a router
+
+    Statements are compared as ordered sets inside each section, so moving a
+    section in the file or a statement inside a section is not a change.
+
+    Args:
+        old (dict): sections of the old config, None if the router is new
+        new (dict): sections of the new config, None if the router was removed
+    """
+    old = old or {}
+    new = new or {}
+    diff = RouterDiff(router)
+    for key, statements in new.items():
+        if key not in old:
+            if key != GLOBAL or statements:
+                diff.added[key] = statements
+            continue
+        previous = dict.fromkeys(old[key])
+        current = dict.fromkeys(statements)
+        added = [s for s in current if s not in previous]
+        removed = [s for s in previous if s not in current]
+        if added or removed:
+            diff.changed[key] = (added, removed)
+    for key, statements in old.items():
+        if key not in new and (key != GLOBAL or statements):
+            diff.removed[key] = statements
+    return diff
+
+
+def diff_files(router, old_file, new_file):
+    return diff_sections(router, read_sections(old_file), read_sections(new_file))
+
+
+def _diff_entry(item):
+    return diff_files(*item)
+
+
+def config_files(configs_dir):
+    """
+    Map router name -> path of every '*_startup-config.cfg' file of a directory
+    """
+    files = {}
+    if not os.path.isdir(configs_dir):
+        return files
+    with os.scandir(configs_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith('_startup-config.cfg') and entry.is_file():
+                files[entry.name.split('_')[0]] = entry.path
+    return files
+
+
+def deployed_files(deployed, routers):
+    """
+    Map router name -> path of its deployed config
+
+    Args:
+        deployed (str): directory of '*_startup-config.cfg' files, or a GNS3
+            '.gns3' project whose dynamips nodes are looked up by name
+        routers (iterable): routers of the generated configs
+    """
+    if not deployed.endswith('.gns3'):
+        return config_files(deployed)
+    from drag_drop_bot import node_config_file
+
+    files = {}
+    for router in routers:
+        location = node_config_file(deployed, router)
+        if location is not None and os.path.exists(location[1]):
+            files[router] = location[1]
+    return files
+
+
+def diff_configs(old_files, new_files, jobs=1):
+    """
+    Diff the configs of every router found on either side
+
+    Args:
+        old_files (dict): router -> old config file
+        new_files (dict): router -> new config file
+        jobs (int): number of worker processes; routers are spread over a process pool when > 1
+
+    Returns:
+        dict: router -> RouterDiff, sorted by router name
+    """
+    routers = sorted(set(old_files) | set(new_files))
+    items = [(router, old_files.get(router), new_files.get(router)) for router in routers]
+    if jobs <= 1 or len(items) <= 1:
+        return {diff.router: diff for diff in map(_diff_entry, items)}
+    chunksize = max(1, len(items) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return {diff.router: diff for diff in pool.map(_diff_entry, items, chunksize=chunksize)}
+
+
+def routers_to_push(diffs):
+    """
+    Routers whose new config differs from the old one
+    """
+    return [router for router, diff in diffs.items() if diff.needs_push]
+
+
+def format_diff(diff):
+    """
+    Human-readable lines of a RouterDiff
+    """
+    lines = []
+    for key, statements in diff.added.items():
+        lines.append(f"+ {section_name(key)}")
+        lines += [f"+   {s}" for s in statements]
+    for key, statements in diff.removed.items():
+        lines.append(f"- {section_name(key)}")
+        lines += [f"-   {s}" for s in statements]
+    for key, (added, removed) in diff.changed.items():
+        lines.append(f"~ {section_name(key)}")
+        lines += [f"-   {s}" for s in removed]
+        lines += [f"+   {s}" for s in added]
+    return lines
+
+
+def main(argv=None):
+    """
+    Compare deployed (or previously generated) configs with newly generated ones
+    """
+    parser = argparse.ArgumentParser(description="Section-aware diff of router configs")
+    parser.add_argument("old", help="directory of the deployed/previous configs, or a GNS3 .gns3 project")
+    parser.add_argument("new", nargs="?", default="configs", help="directory of the new configs (default: configs)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes used to diff the configs (default: 1)")
+    parser.add_argument("--json", help="also write the diff of every router to this JSON file")
+    parser.add_argument("--quiet", "-q", action="store_true", help="only print the routers that need a push")
+    args = parser.parse_args(argv)
+
+    new_files = config_files(args.new)
+    diffs = diff_configs(deployed_files(args.old, new_files), new_files, jobs=args.jobs)
+    push = routers_to_push(diffs)
+    if not args.quiet:
+        for router in push:
+            print(f"=== {router}")
+            for line in format_diff(diffs[router]):
+                print(line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'push': push, 'routers': [diff.to_dict() for diff in diffs.values() if diff.needs_push]},
+                      f, indent=2)
+    print(f"{len(push)} of {len(diffs)} router(s) need a push: {' '.join(push) or 'none'}")
+    return 1 if push else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,15 @@
+import argparse
+import bisect
 import json
 import os
 import ipaddress
-from collections import defaultdict
-from addresses import get_address_file
-from create_graph import run_network_visualization
+from intent_model import compile_intent
+from validate import validate_intent
+from incremental import (MANIFEST_NAME, REMOVED_DIR, router_inputs, input_digest, file_fingerprint,
+                         load_manifest, record_manifest, plan_changes, retire_configs)
+from instrumentation import STATS, timed_lines, profiled
+from fileutils import atomic_write
+from templating import Address, load_template_set, template_files
 
 def load_intent(file_path):
     """
@@ -12,43 +18,306 @@ def load_intent(file_path):
     with open(file_path) as f:
         return json.load(f)
 
+class PoolExhaustedError(Exception):
+    """
+    Raised when a prefix pool has no more subnets or addresses to hand out
+    """
+
+class PrefixPool:
+    """
+    Hands out blocks of a given prefix length from a network (IPv4 or IPv6).
+
+    Free blocks are kept as a sorted list of [start, end) offset intervals: a
+    fresh pool is a single interval, allocation takes the lowest free block and
+    reserving a block out of order only splits one interval, so even a /64 of
+    /128 addresses costs a few integers.
+    """
+    def __init__(self, network, new_prefix, name=None):
+        self.network = ipaddress.ip_network(network)
+        network = self.network
+        self.new_prefix = new_prefix
+        self.name = name or str(network)
+        if new_prefix == network.max_prefixlen:
+            # /32 pools follow network.hosts(): skip the network and broadcast
+            # addresses, except on /31 and /32 networks where every address is usable;
+            # /128 pools only skip the subnet-router anycast address
+            if network.version == 4:
+                self.first = 1 if network.num_addresses > 2 else 0
+                self.size = network.num_addresses - 2 * self.first
+            else:
+                self.first = 1 if network.num_addresses > 1 else 0
+                self.size = network.num_addresses - self.first
+        else:
+            self.first = 0
+            self.size = 2 ** (new_prefix - network.prefixlen) if network.prefixlen <= new_prefix else 0
+        self.block_size = 2 ** (network.max_prefixlen - new_prefix)
+        self.free = [[0, self.size]] if self.size > 0 else [] # sorted free [start, end) offsets
+
+    def __len__(self):
+        return self.size
+
+    def available(self):
+        """
+        Number of blocks that can still be allocated
+        """
+        return sum(end - start for start, end in self.free)
+
+    def allocate(self):
+        """
+        Return the lowest free block as an IPv4Network or IPv6Network
+        """
+        if not self.free:
+            raise PoolExhaustedError(f"pool {self.name} is exhausted: "
+                                     f"all {self.size} {pool_unit(self.network, self.new_prefix)} are allocated")
+        interval = self.free[0]
+        offset = interval[0]
+        interval[0] += 1
+        if interval[0] == interval[1]:
+            self.free.pop(0)
+        if STATS.enabled:
+            STATS.count("allocations")
+        start = int(self.network.network_address) + (self.first + offset) * self.block_size
+        return ipaddress.ip_network((start, self.new_prefix)) if self.network.version == 6 \
+            else ipaddress.IPv4Network((start, self.new_prefix))
+
+    def reserve(self, network):
+        """
+        Mark a block (or a single address) as used so that allocate() skips it
+
+        Returns:
+            bool: False if the block is not an aligned block of this pool or is already used
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        if network.prefixlen != self.new_prefix or network.version != self.network.version:
+            return False
+        offset = (int(network.network_address) - int(self.network.network_address)) // self.block_size - self.first
+        i = bisect.bisect_right(self.free, [offset, float('inf')]) - 1
+        if i < 0 or not self.free[i][0] <= offset < self.free[i][1]:
+            return False
+        start, end = self.free[i]
+        self.free[i:i + 1] = [interval for interval in ([start, offset], [offset + 1, end])
+                              if interval[0] < interval[1]]
+        return True
+
+    def allocate_address(self):
+        """
+        Return the next free block as a single address (for /32 and /128 pools)
+        """
+        return self.allocate().network_address
+
+class ChainedPool:
+    """
+    Several prefixes used as one pool: blocks come from the first prefix until it
+    is exhausted, then from the next one
+    """
+    def __init__(self, networks, new_prefix, name):
+        self.name = name
+        self.new_prefix = new_prefix
+        self.pools = [
+            PrefixPool(network, new_prefix, name=name if len(networks) == 1 else f"{name}[{i}]")
+            for i, network in enumerate(networks)
+        ]
+        self.current = 0 # index of the pool blocks are taken from
+
+    def __len__(self):
+        return sum(len(pool) for pool in self.pools)
+
+    def available(self):
+        return sum(pool.available() for pool in self.pools)
+
+    def allocate(self):
+        # blocks are never given back, so an exhausted pool stays exhausted
+        while self.current < len(self.pools):
+            pool = self.pools[self.current]
+            if pool.free:
+                return pool.allocate()
+            self.current += 1
+        unit = pool_unit(self.pools[0].network, self.new_prefix) if self.pools else "blocks"
+        raise PoolExhaustedError(f"pool {self.name} is exhausted: all {len(self)} {unit} are allocated")
+
+    def reserve(self, network):
+        return any(pool.reserve(network) for pool in self.pools)
+
+    def allocate_address(self):
+        return self.allocate().network_address
+
+def pool_unit(network, new_prefix):
+    return "addresses" if new_prefix == network.max_prefixlen else f"/{new_prefix} subnets"
+
+def prefix_list(value):
+    """
+    Networks of an intent prefix field: a single prefix or a list of prefixes to chain
+    """
+    if value is None:
+        return []
+    return [ipaddress.ip_network(prefix) for prefix in ([value] if isinstance(value, str) else value)]
+
+def link_key(router, local_intf, peer_router, peer_intf):
+    """
+    Lease key of a core link: its two endpoints ('R1:GigabitEthernet1/0'), sorted,
+    so parallel links between the same routers get a subnet each
+    """
+    return tuple(sorted([f"{router}:{local_intf}", f"{peer_router}:{peer_intf}"]))
+
+def subnet_hosts(subnet):
+    """
+    Return the usable host IPs of a small subnet (like a /30 or a /127) without calling hosts()
+    """
+    start = int(subnet.network_address)
+    address = type(subnet.network_address)
+    if subnet.num_addresses <= 2:
+        return [address(start + i) for i in range(subnet.num_addresses)]
+    return [address(start + i) for i in range(1, subnet.num_addresses - 1)]
+
+# version of the ledger format: 2 keys link leases by their endpoints
+LEDGER_VERSION = 2
+
 class IPAllocator:
     """
     Manages IP address allocation for router interfaces and loopbacks
     """
-    def __init__(self, intent):
-        self.intent = intent
-        sp = intent['network']['service_provider']
-        self.base_network = ipaddress.IPv4Network(sp['base_prefix'])
-        self.sp_loopback_network = ipaddress.IPv4Network(sp['loopback_prefix'])
-        self.customer_loopback_networks = {
-            cust['name']: ipaddress.IPv4Network(cust['loopback_prefix'])
-            for cust in intent['network']['customers']
+    def __init__(self, model):
+        self.model = model
+        sp = model.sp
+        # 'base_prefix' and 'loopback_prefix' are a prefix or a list of prefixes
+        # used one after the other, each pool keeps its free blocks as intervals
+        self.link_pool = ChainedPool(prefix_list(sp['base_prefix']), 30, name="service_provider.base_prefix")
+        self.sp_loopback_pool = ChainedPool(prefix_list(sp['loopback_prefix']), 32,
+                                            name="service_provider.loopback_prefix")
+        self.ce_loopback_pools = {
+            cust['name']: ChainedPool(prefix_list(cust['loopback_prefix']), 32, name=f"{cust['name']}.loopback_prefix")
+            for cust in model.customers
+        }
+        self.customer_subnet_pools = {
+            cust['name']: ChainedPool(prefix_list(cust['base_prefix']), 30, name=f"{cust['name']}.base_prefix")
+            for cust in model.customers
         }
-        self.link_subnets = {} # to store allocated subnets for SP core links
+        # optional IPv6 core: /127 links and /128 loopbacks next to the IPv4 ones
+        self.has_ipv6 = 'base_prefix_v6' in sp and 'loopback_prefix_v6' in sp
+        if self.has_ipv6:
+            self.link_pool_v6 = ChainedPool(prefix_list(sp['base_prefix_v6']), 127,
+                                            name="service_provider.base_prefix_v6")
+            self.sp_loopback_pool_v6 = ChainedPool(prefix_list(sp['loopback_prefix_v6']), 128,
+                                                   name="service_provider.loopback_prefix_v6")
+        self.link_subnets_v6 = {}
+        self.loopback_ips_v6 = {}
+        self.link_subnets = {} # to store allocated subnets for SP core links, keyed by link_key()
         self.loopback_ips = {}
         self.ce_loopback_ips = {}
-        self.sp_loopback_counter = 0
-        self.ce_loopback_counters = {cust['name']: 0 for cust in intent['network']['customers']}
-        self.ce_to_customer = {}
-        for peer in intent['protocols']['bgp']['ebgp_peers']:
-            ce = peer['ce']
-            vrf = peer['vrf']
-            customer = next(cust for cust in intent['network']['customers'] if vrf in cust['vrfs'])
-            self.ce_to_customer[ce] = customer['name']
-        self.customer_subnets = defaultdict(list) # to store customer subnets, keyed by customer name
-
-
-    def get_link_subnet(self, router_a, router_b):
+        self.ce_to_customer = {ce: cust['name'] for ce, cust in model.customer_by_ce.items()}
+        self.peer_subnets = {} # to store PE-CE subnets, keyed by CE router
+
+    def restore(self, ledger):
+        """
+        Reuse the leases of a previous run so existing routers keep their addresses.
+
+        Leases that no longer fit their pool (prefix changed in the intent, CE
+        moved to another customer) or collide with another lease are dropped
+        and allocated again.
+        """
+        for key, subnet in self._ledger_links(ledger, 'links'):
+            if key not in self.link_subnets and self.link_pool.reserve(subnet):
+                self.link_subnets[key] = subnet_hosts(ipaddress.IPv4Network(subnet))
+        for router, ip in ledger.get('sp_loopbacks', {}).items():
+            if self.sp_loopback_pool.reserve(ip):
+                self.loopback_ips[router] = ip
+        for router, ip in ledger.get('ce_loopbacks', {}).items():
+            pool = self.ce_loopback_pools.get(self.ce_to_customer.get(router))
+            if pool is not None and pool.reserve(ip):
+                self.ce_loopback_ips[router] = ip
+        for ce, subnet in ledger.get('peer_subnets', {}).items():
+            pool = self.customer_subnet_pools.get(self.ce_to_customer.get(ce))
+            if pool is not None and pool.reserve(subnet):
+                self.peer_subnets[ce] = ipaddress.IPv4Network(subnet)
+        if self.has_ipv6:
+            for key, subnet in self._ledger_links(ledger, 'links_v6'):
+                if key not in self.link_subnets_v6 and self.link_pool_v6.reserve(subnet):
+                    self.link_subnets_v6[key] = subnet_hosts(ipaddress.IPv6Network(subnet))
+            for router, ip in ledger.get('sp_loopbacks_v6', {}).items():
+                if self.sp_loopback_pool_v6.reserve(ip):
+                    self.loopback_ips_v6[router] = ip
+        return self
+
+    def live_links(self):
+        """
+        Lease keys of the core links of the intent, in link order
+        """
+        return {
+            link_key(router, local_intf, peer_router, peer_intf): tuple(sorted([router, peer_router]))
+            for router in self.model.sp_routers
+            for local_intf, peer_router, peer_intf in self.model.core_links.get(router, [])
+        }
+
+    def _ledger_links(self, ledger, field):
+        """
+        (link key, subnet) pairs of the link leases of a ledger.
+
+        Version 1 ledgers keyed links by router pair ('R1|R2'); such a lease
+        goes to the first link between the two routers.
+        """
+        leases = ledger.get(field)
+        if not leases:
+            return []
+        if ledger.get('version', 1) >= 2:
+            return [(tuple(sorted(lease['endpoints'])), lease['subnet']) for lease in leases]
+        first_link = {}
+        for key, pair in self.live_links().items():
+            first_link.setdefault(pair, key)
+        return [
+            (first_link[tuple(sorted(pair.split('|')))], subnet)
+            for pair, subnet in leases.items()
+            if tuple(sorted(pair.split('|'))) in first_link
+        ]
+
+    def export_ledger(self, reclaim=False):
+        """
+        Return the leases as a JSON-serialisable ledger
+
+        Args:
+            reclaim (bool): drop the leases of links and routers that are no longer in the intent
+        """
+        links = {
+            key: ipaddress.ip_network(f"{hosts[0]}/30", strict=False)
+            for key, hosts in self.link_subnets.items()
+        }
+        links_v6 = {
+            key: ipaddress.ip_network(f"{hosts[0]}/127", strict=False)
+            for key, hosts in self.link_subnets_v6.items()
+        }
+        loopbacks, ce_loopbacks, peer_subnets = self.loopback_ips, self.ce_loopback_ips, self.peer_subnets
+        loopbacks_v6 = self.loopback_ips_v6
+        if reclaim:
+            model = self.model
+            live_links = self.live_links()
+            links = {key: subnet for key, subnet in links.items() if key in live_links}
+            links_v6 = {key: subnet for key, subnet in links_v6.items() if key in live_links}
+            loopbacks = {r: ip for r, ip in loopbacks.items() if r in model.sp_routers}
+            loopbacks_v6 = {r: ip for r, ip in loopbacks_v6.items() if r in model.sp_routers}
+            ce_loopbacks = {r: ip for r, ip in ce_loopbacks.items() if model.is_ce(r)}
+            peer_subnets = {r: subnet for r, subnet in peer_subnets.items() if model.is_ce(r)}
+        ledger = {
+            'version': LEDGER_VERSION,
+            'links': [{'endpoints': list(key), 'subnet': str(subnet)} for key, subnet in sorted(links.items())],
+            'sp_loopbacks': dict(sorted(loopbacks.items())),
+            'ce_loopbacks': dict(sorted(ce_loopbacks.items())),
+            'peer_subnets': {ce: str(subnet) for ce, subnet in sorted(peer_subnets.items())},
+        }
+        if self.has_ipv6:
+            ledger['links_v6'] = [
+                {'endpoints': list(key), 'subnet': str(subnet)} for key, subnet in sorted(links_v6.items())
+            ]
+            ledger['sp_loopbacks_v6'] = dict(sorted(loopbacks_v6.items()))
+        return ledger
+
+    def get_link_subnet(self, router, local_intf, peer_router, peer_intf):
         """
         Allocate a /30 subnet for a link between 2 SP routers.
         """
-        key = tuple(sorted([router_a, router_b]))
+        key = link_key(router, local_intf, peer_router, peer_intf)
         if key not in self.link_subnets:
-            # subnet the base network into /30 networks and take the next available one
-            subnet = list(self.base_network.subnets(new_prefix=30))[len(self.link_subnets)]
-            hosts = list(subnet.hosts()) # get only the usable host IPs
-            self.link_subnets[key] = hosts
+            # take the next available /30 of the base network
+            subnet = self.link_pool.allocate()
+            self.link_subnets[key] = subnet_hosts(subnet) # get only the usable host IPs
         return self.link_subnets[key]
 
     def get_sp_loopback_ip(self, router):
@@ -56,55 +325,110 @@ class IPAllocator:
         Allocate a /32 loopback ip for an SP router
         """
         if router not in self.loopback_ips:
-            ip = list(self.sp_loopback_network.hosts())[self.sp_loopback_counter]
+            ip = self.sp_loopback_pool.allocate_address()
             self.loopback_ips[router] = f"{ip}/32"
-            self.sp_loopback_counter += 1
         return self.loopback_ips[router]
 
+    def get_link_subnet_v6(self, router, local_intf, peer_router, peer_intf):
+        """
+        Allocate a /127 IPv6 subnet for a link between 2 SP routers
+        """
+        key = link_key(router, local_intf, peer_router, peer_intf)
+        if key not in self.link_subnets_v6:
+            self.link_subnets_v6[key] = subnet_hosts(self.link_pool_v6.allocate())
+        return self.link_subnets_v6[key]
+
+    def get_sp_loopback_ip_v6(self, router):
+        """
+        Allocate a /128 IPv6 loopback for an SP router
+        """
+        if router not in self.loopback_ips_v6:
+            ip = self.sp_loopback_pool_v6.allocate_address()
+            self.loopback_ips_v6[router] = f"{ip}/128"
+        return self.loopback_ips_v6[router]
+
     def get_ce_loopback_ip(self, router):
         """
         Allocate a /32 loopback ip for CE router
         """
         if router not in self.ce_loopback_ips:
             customer_name = self.ce_to_customer[router]
-            counter = self.ce_loopback_counters[customer_name]
-            network = self.customer_loopback_networks[customer_name]
-            ip = list(network.hosts())[counter]
+            ip = self.ce_loopback_pools[customer_name].allocate_address()
             self.ce_loopback_ips[router] = f"{ip}/32"
-            self.ce_loopback_counters[customer_name] += 1
         return self.ce_loopback_ips[router]
 
-    def get_customer_subnet(self, customer, interface):
+    def get_peer_subnet(self, ce):
         """
-        Allocate a /30 subnet for PE-CE link
+        Allocate a /30 subnet for the PE-CE link of a CE router
 
         Args:
-            customer (dict): Customer data such as 'base_prefix' and 'name'
-            interface (str): Interface name (like 'GigabitEthernet2/0')
+            ce (str): CE router name (like 'R5'), the subnet comes from its customer's 'base_prefix'
 
         Returns:
-            list: List of IPs in the subnet
+            IPv4Network: the allocated /30 subnet
         """
-        base = ipaddress.IPv4Network(customer['base_prefix'])
-        index = len(self.customer_subnets[customer['name']])
-        subnet = list(base.subnets(new_prefix=30))[index]
-        self.customer_subnets[customer['name']].append(subnet)
-        return subnet
+        if ce not in self.peer_subnets:
+            customer_name = self.ce_to_customer[ce]
+            self.peer_subnets[ce] = self.customer_subnet_pools[customer_name].allocate()
+        return self.peer_subnets[ce]
 
-def generate_base_config(router, is_ce=False):
+def load_ledger(path):
+    """
+    Load the allocation ledger of a previous run, or an empty one if there is none
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_ledger(path, ledger):
+    """
+    Write the allocation ledger atomically
+    """
+    with atomic_write(path) as f:
+        json.dump(ledger, f, indent=2)
+
+def allocate_addresses(model, allocator):
+    """
+    Phase one of generation: allocate every address the configs need.
+
+    Routers are walked in the same order as the renderers consume addresses,
+    so the result matches a serial run; afterwards rendering is a read-only
+    lookup and routers can be rendered in any order or in parallel.
+    """
+    for router in model.all_routers:
+        if model.is_ce(router):
+            allocator.get_ce_loopback_ip(router)
+            continue
+        allocator.get_sp_loopback_ip(router)
+        for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+            allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+        if allocator.has_ipv6:
+            allocator.get_sp_loopback_ip_v6(router)
+            for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+                allocator.get_link_subnet_v6(router, local_intf, peer_router, peer_intf)
+        if model.is_pe(router):
+            for pe_link in model.peers_by_pe.get(router, []):
+                allocator.get_peer_subnet(pe_link['ce'])
+            for peer in model.ibgp_peers(router):
+                allocator.get_sp_loopback_ip(peer)
+    return allocator
+
+def generate_base_config(router, is_ce=False, ipv6=False):
     """
     Generates basic router configuration commands
     """
-    config = [
+    yield from [
         "!",
         f"hostname {router}",
         "no ip domain lookup",
         "ip cef",
     ]
     if not is_ce: # MPLS is only for SP routers (PE and P)
-        config += ["mpls label protocol ldp"]
-    config += ["!"]
-    return config
+        yield "mpls label protocol ldp"
+    if ipv6:
+        yield "ipv6 unicast-routing"
+    yield "!"
 
 def configure_loopback(router, allocator, is_ce=False):
     """
@@ -115,68 +439,64 @@ def configure_loopback(router, allocator, is_ce=False):
 
     # choose ce or sp loopback ip based on the router type
     ip = allocator.get_ce_loopback_ip(router) if is_ce else allocator.get_sp_loopback_ip(router)
-    return [
+    yield from [
         "interface Loopback0",
         f" ip address {ip.split('/')[0]} 255.255.255.255",
-        "!"
     ]
+    if not is_ce and allocator.has_ipv6:
+        yield from [
+            f" ipv6 address {allocator.get_sp_loopback_ip_v6(router)}",
+            " ipv6 ospf 1 area 0",
+        ]
+    yield "!"
 
-def configure_interfaces(router, intent, allocator):
+def configure_interfaces(router, model, allocator):
     """
     configure physical interfaces for an SP router
     """
-    config = []
-    sp = intent['network']['service_provider']
-    
     # Core interfaces for SP routers
-    for link in sp['links']:
-        if router in link['from'] and not link['to'].startswith("CE:"):
-            _, local_intf = link['from'].split(':', 1)
-            peer_router, peer_intf = link['to'].split(':', 1)
-            hosts = allocator.get_link_subnet(router, peer_router)
-            # Assign hosts[0] to the lower-named router and hosts[1] to the higher-named router
-            ip = hosts[0] if router < peer_router else hosts[1]
-            config += [
-                f"interface {local_intf}",
-                f" ip address {ip} 255.255.255.252",
+    for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+        hosts = allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+        # Assign hosts[0] to the lower-named router and hosts[1] to the higher-named router
+        ip = hosts[0] if router < peer_router else hosts[1]
+        yield from [
+            f"interface {local_intf}",
+            f" ip address {ip} 255.255.255.252",
+        ]
+        if allocator.has_ipv6:
+            hosts_v6 = allocator.get_link_subnet_v6(router, local_intf, peer_router, peer_intf)
+            yield from [
+                f" ipv6 address {hosts_v6[0] if router < peer_router else hosts_v6[1]}/127",
+                " ipv6 ospf 1 area 0",
+            ]
+        yield from [
+            " negotiation auto",
+            " mpls ip",
+            " no shutdown",
+            "!"
+        ]
+
+    # Customer-facing interfaces for PE routers
+    if model.is_pe(router):
+        for pe_link in model.peers_by_pe.get(router, []):
+            subnet = allocator.get_peer_subnet(pe_link['ce'])
+            yield from [
+                f"interface {pe_link['interface']}",
+                f" ip vrf forwarding {pe_link['vrf']}",
+                f" ip address {subnet[2]} 255.255.255.252",  # PE gets second host IP
                 " negotiation auto",
-                " mpls ip",
                 " no shutdown",
                 "!"
             ]
-    
-    # Customer-facing interfaces for PE routers
-    if router in sp['routers']['PE']:
-        for pe_link in intent['protocols']['bgp']['ebgp_peers']:
-            if pe_link['pe'] == router:
-                customer = next(cust for cust in intent['network']['customers'] if pe_link['vrf'] in cust['vrfs'])
-                subnet = allocator.get_customer_subnet(customer, pe_link['interface'])
-                config += [
-                    f"interface {pe_link['interface']}",
-                    f" ip vrf forwarding {pe_link['vrf']}",
-                    f" ip address {subnet[2]} 255.255.255.252",  # PE gets second host IP
-                    " negotiation auto",
-                    " no shutdown",
-                    "!"
-                ]
-    return config
-
-def configure_ce_interfaces(router, intent, allocator):
+
+def configure_ce_interfaces(router, model, allocator):
     """
     configure the interface for a ce router facing its pe
     """
 
-    pe_link = next(p for p in intent['protocols']['bgp']['ebgp_peers'] if p['ce'] == router)
-    vrf = pe_link['vrf']
-    customer = next(cust for cust in intent['network']['customers'] if vrf in cust['vrfs'])
-    customer_pe_links = [p for p in intent['protocols']['bgp']['ebgp_peers'] if p['vrf'] == vrf]
-    index = customer_pe_links.index(pe_link)
-    subnet = allocator.customer_subnets[customer['name']][index]
-    for link in intent['network']['service_provider']['links']:
-        if link['to'].startswith(f"CE:{router}:"):
-            ce_intf = link['to'].split(':')[2]
-            break
-    return [
+    subnet = allocator.get_peer_subnet(router)
+    ce_intf = model.ce_interface[router]
+    yield from [
         f"interface {ce_intf}",
         f" ip address {subnet[1]} 255.255.255.252",  # CE gets first host IP
         " negotiation auto",
@@ -184,94 +504,91 @@ def configure_ce_interfaces(router, intent, allocator):
         "!"
     ]
 
-def configure_ospf(router, intent, allocator):
+def configure_ospf(router, model, allocator):
     """
     configure ospf for an sp router 
     """
-    config = ["router ospf 1"]
-    networks = []
-    for link in intent['network']['service_provider']['links']:
-        if router in link['from'] and not link['to'].startswith("CE:"):
-            peer_router = link['to'].split(':')[0]
-            hosts = allocator.get_link_subnet(router, peer_router)
-            # Derive network address from the first host IP
-            network = ipaddress.ip_network(f"{hosts[0]}/30", strict=False)
-            networks.append(f" network {network.network_address} 0.0.0.3 area 0")
+    yield "router ospf 1"
+    for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+        hosts = allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+        # Derive network address from the first host IP
+        network = ipaddress.ip_network(f"{hosts[0]}/30", strict=False)
+        yield f" network {network.network_address} 0.0.0.3 area 0"
     loopback_ip = allocator.get_sp_loopback_ip(router).split('/')[0]
-    networks.append(f" network {loopback_ip} 0.0.0.0 area 0")
-    return config + networks + ["!"]
+    yield f" network {loopback_ip} 0.0.0.0 area 0"
+    yield "!"
+    if allocator.has_ipv6:
+        # OSPFv3 for the IPv6 core, enabled on the interfaces themselves
+        yield from [
+            "ipv6 router ospf 1",
+            f" router-id {loopback_ip}",
+            "!",
+        ]
 
-def configure_bgp(router, intent, allocator):
+def configure_bgp(router, model, allocator):
     """
     configure bgp for pe routers
     """
 
-    sp = intent['network']['service_provider']
-    config = [
-        f"router bgp {sp['asn']}",
+    asn = model.asn
+    yield from [
+        f"router bgp {asn}",
         " bgp log-neighbor-changes",
     ]
-    
-    # iBGP with other PE routers
-    for peer in sp['routers']['PE']:
-        if peer != router:
-            peer_ip = allocator.get_sp_loopback_ip(peer).split('/')[0]
-            config += [
-                f" neighbor {peer_ip} remote-as {sp['asn']}",
-                f" neighbor {peer_ip} update-source Loopback0",
-            ]
-    
-    config += ["!\n address-family vpnv4"]
+    if router in model.cluster_id:
+        yield f" bgp cluster-id {model.cluster_id[router]}"
+    peer_ips = [
+        allocator.get_sp_loopback_ip(peer).split('/')[0]
+        for peer in model.ibgp_peers(router)
+    ]
+
+    # iBGP with the other PE routers (full mesh) or with the reflectors / clients of this PE
+    for peer_ip in peer_ips:
+        yield from [
+            f" neighbor {peer_ip} remote-as {asn}",
+            f" neighbor {peer_ip} update-source Loopback0",
+        ]
+
+    yield "!\n address-family vpnv4"
     # Add route reflector neighbors
-    if router in sp.get('route_reflectors', []):
-        for peer in sp['routers']['PE']:
-            if peer != router:
-                peer_ip = allocator.get_sp_loopback_ip(peer).split('/')[0]
-                config += [f"  neighbor {peer_ip} route-reflector-client"]
-    for peer in sp['routers']['PE']:
-        if peer != router:
-            peer_ip = allocator.get_sp_loopback_ip(peer).split('/')[0]
-            config += [
-                f"  neighbor {peer_ip} activate",
-                f"  neighbor {peer_ip} send-community extended",
-            ]
-    config += [" exit-address-family", "!"]
-    
+    for client in model.rr_clients.get(router, []):
+        client_ip = allocator.get_sp_loopback_ip(client).split('/')[0]
+        yield f"  neighbor {client_ip} route-reflector-client"
+    for peer_ip in peer_ips:
+        yield from [
+            f"  neighbor {peer_ip} activate",
+            f"  neighbor {peer_ip} send-community extended",
+        ]
+    yield from [" exit-address-family", "!"]
+
     # Configure eBGP for customer VRFs
-    for pe_link in intent['protocols']['bgp']['ebgp_peers']:
-        if pe_link['pe'] == router:
-            vrf = pe_link['vrf']
-            customer = next(cust for cust in intent['network']['customers'] if vrf in cust['vrfs'])
-            index = [p['ce'] for p in intent['protocols']['bgp']['ebgp_peers'] if p['vrf'] == vrf].index(pe_link['ce'])
-            subnet = allocator.customer_subnets[customer['name']][index]
-            ce_ip = subnet[1]  # CE’s IP matches its interface IP
-            config += [
-                f" address-family ipv4 vrf {vrf}",
-                "  redistribute connected",
-                f"  neighbor {ce_ip} remote-as {customer['asn']}",
-                f"  neighbor {ce_ip} activate",
-                " exit-address-family",
-                "!"
-            ]
-    return config
+    for pe_link in model.peers_by_pe.get(router, []):
+        vrf = pe_link['vrf']
+        customer = model.customer_by_vrf[vrf]
+        subnet = allocator.get_peer_subnet(pe_link['ce'])
+        ce_ip = subnet[1]  # CE’s IP matches its interface IP
+        yield from [
+            f" address-family ipv4 vrf {vrf}",
+            "  redistribute connected",
+            f"  neighbor {ce_ip} remote-as {customer['asn']}",
+            f"  neighbor {ce_ip} activate",
+            " exit-address-family",
+            "!"
+        ]
 
-def configure_ce_bgp(router, intent, allocator):
+def configure_ce_bgp(router, model, allocator):
     """
     configure bgp for a ce router 
     
     """
-    pe_link = next(p for p in intent['protocols']['bgp']['ebgp_peers'] if p['ce'] == router)
-    vrf = pe_link['vrf']
-    customer = next(cust for cust in intent['network']['customers'] if vrf in cust['vrfs'])
-    customer_pe_links = [p for p in intent['protocols']['bgp']['ebgp_peers'] if p['vrf'] == vrf]
-    index = customer_pe_links.index(pe_link)
-    subnet = allocator.customer_subnets[customer['name']][index]
+    customer = model.customer_by_ce[router]
+    subnet = allocator.get_peer_subnet(router)
     pe_ip = subnet[2]  # PE’s interface IP
     loopback_ip = allocator.get_ce_loopback_ip(router).split('/')[0]
-    return [
+    yield from [
         f"router bgp {customer['asn']}",
         " bgp log-neighbor-changes",
-        f" neighbor {pe_ip} remote-as {intent['network']['service_provider']['asn']}",
+        f" neighbor {pe_ip} remote-as {model.asn}",
         " !",
         " address-family ipv4",
         f"  network {loopback_ip} mask 255.255.255.255",
@@ -280,23 +597,16 @@ def configure_ce_bgp(router, intent, allocator):
         "!"
     ]
 
-def configure_vrfs(router, intent):
+def configure_vrfs(router, model):
     """
     configure VRFs for PE routers
     """
-    if router not in intent['network']['service_provider']['routers']['PE']:
-        return [] # only PE routers need VRFs
-    
-    vrfs = set() # to collect unique VRFs for a given PE
-    for peer in intent['protocols']['bgp']['ebgp_peers']:
-        if peer['pe'] == router:
-            vrfs.add(peer['vrf'])
-    
-    config = []
-    for vrf in vrfs:
-        customer = next(cust for cust in intent['network']['customers'] if vrf in cust['vrfs'])
-        vrf_info = customer['vrfs'][vrf]
-        config += [
+    if not model.is_pe(router):
+        return # only PE routers need VRFs
+
+    for vrf in model.vrfs_by_pe.get(router, []):
+        vrf_info = model.customer_by_vrf[vrf]['vrfs'][vrf]
+        yield from [
             f"ip vrf {vrf}",
             f" rd {vrf_info['rd']}",
             f" route-target export {vrf_info['rt']}",
@@ -304,54 +614,422 @@ def configure_vrfs(router, intent):
         ]
         if 'import_rts' in vrf_info:
             for rt in vrf_info['import_rts']:
-                config += [f" route-target import {rt}"]
-        config += ["!"]
-    return config
+                yield f" route-target import {rt}"
+        yield "!"
 
-def generate_config(router, intent, allocator, is_ce):
+def iter_config(router, model, allocator, is_ce):
     """
-    generate the full configuration for a router
+    Yield the lines of the full configuration of a router, section by section
     """
 
-    config = generate_base_config(router, is_ce)
+    ipv6 = not is_ce and allocator.has_ipv6
+    yield from timed_lines("generate_base_config", generate_base_config(router, is_ce, ipv6))
     
     # Add VRFs for PE routers only
-    if not is_ce and router in intent['network']['service_provider']['routers']['PE']:
-        config += configure_vrfs(router, intent)
+    if not is_ce and model.is_pe(router):
+        yield from timed_lines("configure_vrfs", configure_vrfs(router, model))
     
-    config += configure_loopback(router, allocator, is_ce)
+    yield from timed_lines("configure_loopback", configure_loopback(router, allocator, is_ce))
     if not is_ce:
         # SP router configs
-        config += configure_interfaces(router, intent, allocator)
-        config += configure_ospf(router, intent, allocator)
-        if router in intent['network']['service_provider']['routers']['PE']:
-            config += configure_bgp(router, intent, allocator)
+        yield from timed_lines("configure_interfaces", configure_interfaces(router, model, allocator))
+        yield from timed_lines("configure_ospf", configure_ospf(router, model, allocator))
+        if model.is_pe(router):
+            yield from timed_lines("configure_bgp", configure_bgp(router, model, allocator))
     else:
         # CE router configs
-        config += configure_ce_interfaces(router, intent, allocator)
-        config += configure_ce_bgp(router, intent, allocator)
-    
-    return "\n".join(config)
+        yield from timed_lines("configure_ce_interfaces", configure_ce_interfaces(router, model, allocator))
+        yield from timed_lines("configure_ce_bgp", configure_ce_bgp(router, model, allocator))
 
-def main():
+def template_base_config(router, templates, is_ce, ipv6):
     """
-    Main function to generate config files for all routers
+    global statements of a router, from the base template
+    """
+    base = templates.base
+    yield base.header(router=router)
+    if not is_ce:
+        yield base.mpls()
+    if ipv6:
+        yield base.ipv6()
+    yield base.end()
+
+def template_vrfs(router, model, templates):
+    """
+    VRFs of a PE router, from the vrf template
+    """
+    vrf_section = templates.vrf
+    for vrf in model.vrfs_by_pe.get(router, []):
+        vrf_info = model.customer_by_vrf[vrf]['vrfs'][vrf]
+        yield vrf_section.vrf(vrf=vrf, rd=vrf_info['rd'], rt=vrf_info['rt'])
+        for rt in vrf_info.get('import_rts', ()):
+            yield vrf_section.extra_import(vrf=vrf, rt=rt)
+        yield vrf_section.end(vrf=vrf)
+
+def template_loopback(router, allocator, templates, is_ce):
+    """
+    Loopback0 of a router, from the loopback template
+    """
+    loopback = templates.loopback
+    ip = allocator.get_ce_loopback_ip(router) if is_ce else allocator.get_sp_loopback_ip(router)
+    yield loopback.loopback(address=Address.parse(ip))
+    if not is_ce and allocator.has_ipv6:
+        yield loopback.ipv6(address_v6=Address.parse(allocator.get_sp_loopback_ip_v6(router)))
+    yield loopback.end()
+
+def template_interfaces(router, model, allocator, templates):
+    """
+    core and PE-CE interfaces of an SP router, from the interfaces template
+    """
+    interfaces = templates.interfaces
+    for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+        hosts = allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+        address = Address(hosts[0] if router < peer_router else hosts[1], allocator.link_pool.new_prefix)
+        yield interfaces.core(interface=local_intf, address=address)
+        if allocator.has_ipv6:
+            hosts_v6 = allocator.get_link_subnet_v6(router, local_intf, peer_router, peer_intf)
+            address_v6 = Address(hosts_v6[0] if router < peer_router else hosts_v6[1],
+                                 allocator.link_pool_v6.new_prefix)
+            yield interfaces.core_ipv6(interface=local_intf, address_v6=address_v6)
+        yield interfaces.core_end(interface=local_intf)
+    if model.is_pe(router):
+        for pe_link in model.peers_by_pe.get(router, []):
+            subnet = allocator.get_peer_subnet(pe_link['ce'])
+            yield interfaces.pe_ce(interface=pe_link['interface'], vrf=pe_link['vrf'],
+                                   address=Address(subnet[2], subnet.prefixlen))
+
+def template_ce_interfaces(router, model, allocator, templates):
+    """
+    interface of a CE router facing its PE, from the interfaces template
+    """
+    subnet = allocator.get_peer_subnet(router)
+    yield templates.interfaces.ce(interface=model.ce_interface[router], address=Address(subnet[1], subnet.prefixlen))
+
+def template_ospf(router, model, allocator, templates):
+    """
+    OSPF (and OSPFv3 on a dual-stack core) of an SP router, from the ospf template
+    """
+    ospf = templates.ospf
+    yield ospf.start()
+    for local_intf, peer_router, peer_intf in model.core_links.get(router, []):
+        hosts = allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)
+        yield ospf.network(link=Address(hosts[0], allocator.link_pool.new_prefix))
+    loopback = Address.parse(allocator.get_sp_loopback_ip(router))
+    yield ospf.loopback(address=loopback)
+    if allocator.has_ipv6:
+        yield ospf.ipv6(router_id=loopback.ip)
+
+def template_bgp(router, model, allocator, templates):
+    """
+    iBGP/VPNv4 sessions and PE-CE address families of a PE router, from the bgp template
+    """
+    bgp = templates.bgp
+    asn = model.asn
+    yield bgp.start(asn=asn)
+    if router in model.cluster_id:
+        yield bgp.cluster_id(asn=asn, cluster_id=model.cluster_id[router])
+    peer_ips = [
+        allocator.get_sp_loopback_ip(peer).split('/')[0]
+        for peer in model.ibgp_peers(router)
+    ]
+    for peer_ip in peer_ips:
+        yield bgp.neighbor(asn=asn, ip=peer_ip)
+    yield bgp.vpnv4(asn=asn)
+    for client in model.rr_clients.get(router, []):
+        yield bgp.rr_client(asn=asn, ip=allocator.get_sp_loopback_ip(client).split('/')[0])
+    for peer_ip in peer_ips:
+        yield bgp.vpnv4_neighbor(asn=asn, ip=peer_ip)
+    yield bgp.vpnv4_end(asn=asn)
+    for pe_link in model.peers_by_pe.get(router, []):
+        vrf = pe_link['vrf']
+        subnet = allocator.get_peer_subnet(pe_link['ce'])
+        yield bgp.vrf(asn=asn, vrf=vrf, ip=subnet[1], remote_asn=model.customer_by_vrf[vrf]['asn'])
+
+def template_ce_bgp(router, model, allocator, templates):
+    """
+    eBGP session of a CE router towards its PE, from the ce_bgp template
+    """
+    subnet = allocator.get_peer_subnet(router)
+    yield templates.ce_bgp.ce_bgp(
+        asn=model.customer_by_ce[router]['asn'],
+        pe_ip=subnet[2],
+        sp_asn=model.asn,
+        loopback=Address.parse(allocator.get_ce_loopback_ip(router)),
+    )
+
+def iter_template_config(router, model, allocator, is_ce):
+    """
+    Yield the configuration of a router rendered with the template set of its
+    platform, section by section.
+
+    Each item is a block of lines; the addresses come from the allocator, which
+    phase one has already filled, so rendering only looks them up.
+    """
+    templates = load_template_set(model.platform(router))
+    ipv6 = not is_ce and allocator.has_ipv6
+    yield from timed_lines("template_base_config", template_base_config(router, templates, is_ce, ipv6))
+    if not is_ce and model.is_pe(router):
+        yield from timed_lines("template_vrfs", template_vrfs(router, model, templates))
+    yield from timed_lines("template_loopback", template_loopback(router, allocator, templates, is_ce))
+    if not is_ce:
+        yield from timed_lines("template_interfaces", template_interfaces(router, model, allocator, templates))
+        yield from timed_lines("template_ospf", template_ospf(router, model, allocator, templates))
+        if model.is_pe(router):
+            yield from timed_lines("template_bgp", template_bgp(router, model, allocator, templates))
+    else:
+        yield from timed_lines("template_ce_interfaces", template_ce_interfaces(router, model, allocator, templates))
+        yield from timed_lines("template_ce_bgp", template_ce_bgp(router, model, allocator, templates))
+
+# line generators by --renderer: compiled templates per platform, or the
+# hand-written f-string sections (always Cisco IOS)
+RENDERERS = {"template": iter_template_config, "fstring": iter_config}
+DEFAULT_RENDERER = "template"
+
+def generate_config(router, model, allocator, is_ce, renderer=DEFAULT_RENDERER):
+    """
+    generate the full configuration for a router
+    """
+    return "\n".join(RENDERERS[renderer](router, model, allocator, is_ce))
+
+def write_lines(path, lines, buffer_size=1 << 16):
+    """
+    Stream lines to a file, separated by newlines (no trailing newline).
+
+    The lines go to a temporary file in the same directory which is renamed
+    over the target at the end, so readers never see a half-written config.
+    """
+    with atomic_write(path, buffering=buffer_size) as f:
+        write = f.write
+        separator = ""
+        for line in lines:
+            write(separator)
+            write(line)
+            separator = "\n"
+    if STATS.enabled:
+        STATS.count("files written")
+        STATS.count("bytes written", os.path.getsize(path))
+    return path
+
+# allocation results shared with pool workers, set once per worker process
+_worker_model = None
+_worker_allocator = None
+_worker_renderer = DEFAULT_RENDERER
+
+def _init_worker(model, allocator, instrumented=False, renderer=DEFAULT_RENDERER):
+    global _worker_model, _worker_allocator, _worker_renderer
+    _worker_model = model
+    _worker_allocator = allocator
+    _worker_renderer = renderer
+    STATS.enabled = instrumented
+    STATS.drain() # forked workers inherit the parent's statistics, which are already counted
+
+CONFIG_SUFFIX = "_startup-config.cfg"
+
+def config_path(router, output_dir="configs"):
+    return os.path.join(output_dir, f"{router}{CONFIG_SUFFIX}")
+
+def stale_configs(output_dir, routers):
+    """
+    Routers that still have a config file in output_dir but are not in `routers`
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    live = set(routers)
+    with os.scandir(output_dir) as entries:
+        return sorted(
+            entry.name[:-len(CONFIG_SUFFIX)] for entry in entries
+            if entry.name.endswith(CONFIG_SUFFIX) and entry.is_file()
+            and entry.name[:-len(CONFIG_SUFFIX)] not in live
+        )
+
+def retire_stale_configs(output_dir, routers, known_removed=()):
+    """
+    Move the configs of routers no longer in the intent out of output_dir
+
+    Returns:
+        list: removed routers, from the manifest (`known_removed`) and from the files found
+    """
+    removed = sorted(set(known_removed) | set(stale_configs(output_dir, routers)))
+    retire_configs(output_dir, [
+        config_path(router, output_dir) for router in removed
+        if os.path.exists(config_path(router, output_dir))
+    ])
+    return removed
+
+def write_router_config(router, model, allocator, output_dir="configs", renderer=DEFAULT_RENDERER):
+    """
+    Render the config of one router and write it to its startup-config file
+    """
+    lines = RENDERERS[renderer](router, model, allocator, model.is_ce(router))
+    return write_lines(config_path(router, output_dir), lines)
+
+def _write_router_config_worker(router, output_dir):
+    path = write_router_config(router, _worker_model, _worker_allocator, output_dir, _worker_renderer)
+    # the parent process collects the statistics of its workers
+    return path, STATS.drain() if STATS.enabled else None
+
+def render_configs(model, allocator, routers, output_dir="configs", jobs=1, renderer=DEFAULT_RENDERER):
+    """
+    Phase two of generation: render and write the configs of the given routers.
+
+    With jobs > 1 the routers are spread over a process pool; each worker gets
+    the model and the (already filled) allocator once, so the files are
+    byte-identical to a serial run.
+    """
+    os.makedirs(output_dir, exist_ok=True) # makes configs directory if it doesn't exist
+    if renderer == "template":
+        # compile the template sets up front: forked workers inherit them
+        for platform in set(model.platforms.values()):
+            load_template_set(platform)
+    if jobs <= 1 or len(routers) <= 1:
+        return [write_router_config(router, model, allocator, output_dir, renderer) for router in routers]
+    # the process pool machinery is only loaded when it is used
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(routers) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(model, allocator, STATS.enabled, renderer)) as pool:
+        results = list(pool.map(_write_router_config_worker, routers,
+                                [output_dir] * len(routers), chunksize=chunksize))
+    for _, snapshot in results:
+        if snapshot:
+            STATS.merge(snapshot)
+    return [path for path, _ in results]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate router configs from intent.json")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="number of worker processes used to render configs (default: 1)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rewrite the configs whose intent slice or addresses changed "
+                             "since the last run (tracked in configs/%s)" % MANIFEST_NAME)
+    parser.add_argument("--ledger", metavar="PATH",
+                        help="JSON allocation ledger: existing leases are reused and new ones are recorded")
+    parser.add_argument("--reclaim", action="store_true",
+                        help="with --ledger, release the leases of links and routers no longer in the intent")
+    parser.add_argument("--renderer", choices=sorted(RENDERERS), default=DEFAULT_RENDERER,
+                        help="render with the compiled templates of each platform (default) "
+                             "or with the built-in IOS f-strings")
+    parser.add_argument("--stats", action="store_true",
+                        help="time every stage and configure_* section and print a summary table at the end")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile and write the pstats output to PATH (implies --stats)")
+    return parser.parse_args(argv)
+
+def router_digests(model, allocator, renderer=DEFAULT_RENDERER):
+    """
+    Input digest of every router, including the fingerprint of the renderer
+    """
+    # templates are part of the renderer: editing one invalidates the configs rendered with it
+    sources = [__file__]
+    if renderer == "template":
+        sources += template_files(model.platforms.values())
+    fingerprint = file_fingerprint(*sources)
+    return {
+        router: input_digest(router_inputs(router, model, allocator), fingerprint)
+        for router in model.all_routers
+    }
+
+def generate_incremental(model, allocator, output_dir="configs", jobs=1, renderer=DEFAULT_RENDERER):
+    """
+    Render only the routers whose inputs changed since the previous run.
+
+    The digest of each router's inputs and the hash of its config are stored
+    in the manifest of the output directory; routers whose digest is unchanged
+    and whose file still has the recorded content are skipped. Configs of routers no longer in the intent are moved to
+    the .removed subdirectory.
+
+    Returns:
+        tuple: (rendered routers, routers removed from the intent)
+    """
+    routers = model.all_routers
+    digests = router_digests(model, allocator, renderer)
+    manifest = load_manifest(output_dir)
+    path_of = lambda router: config_path(router, output_dir)
+    changed, removed = plan_changes(routers, digests, manifest, path_of)
+    render_configs(model, allocator, changed, output_dir, jobs=jobs, renderer=renderer)
+    # removed routers leave the live configs; the manifest only keeps the current routers
+    removed = retire_stale_configs(output_dir, routers, removed)
+    record_manifest(output_dir, digests, changed, removed, path_of, previous=manifest)
+    return changed, removed
+
+def generate(args):
+    """
+    Generate config files for all routers from parsed command line arguments
     """
     intent = load_intent("intent.json")
-    allocator = IPAllocator(intent)
-    os.makedirs("configs", exist_ok=True) # makes configs directory if it doesn't exist
-    sp_routers = intent['network']['service_provider']['routers']['PE'] + intent['network']['service_provider']['routers']['P']
-    # set of ce routers from ebgp peers
-    ce_routers = set(peer['ce'] for peer in intent['protocols']['bgp']['ebgp_peers'])
-    all_routers = sp_routers + list(ce_routers) # combines all routers into one list
-    for router in all_routers:
-        is_ce = router in ce_routers # determines if it's a ce router
-        config = generate_config(router, intent, allocator, is_ce)
-        with open(f"configs/{router}_startup-config.cfg", "w") as f:
-            f.write(config)
+    # check the whole intent before anything is allocated or written
+    with STATS.timer("stage validate"):
+        errors = validate_intent(intent)
+    if errors:
+        for error in errors:
+            print(f"Error: {error}")
+        raise SystemExit(f"intent.json: {len(errors)} error(s), no config generated")
+    with STATS.timer("stage compile_intent"):
+        model = compile_intent(intent)
+    with STATS.timer("stage allocate"):
+        allocator = IPAllocator(model)
+        if args.ledger:
+            allocator.restore(load_ledger(args.ledger))
+        allocate_addresses(model, allocator)
+        if args.ledger:
+            save_ledger(args.ledger, allocator.export_ledger(reclaim=args.reclaim))
+    all_routers = model.all_routers # SP routers first, then CE routers in eBGP peer order
+    if args.incremental:
+        with STATS.timer("stage render"):
+            changed, removed = generate_incremental(model, allocator, "configs", jobs=args.jobs,
+                                                    renderer=args.renderer)
+        print(f"Regenerated {len(changed)} of {len(all_routers)} config files in 'configs' directory")
+        if changed:
+            print("Changed routers: " + ", ".join(changed))
+        if removed:
+            print(f"Routers no longer in the intent (configs moved to configs/{REMOVED_DIR}): "
+                  + ", ".join(removed))
+        return
+    with STATS.timer("stage render"):
+        render_configs(model, allocator, all_routers, "configs", jobs=args.jobs, renderer=args.renderer)
+        removed = retire_stale_configs("configs", all_routers)
+        # a later --incremental run must start from what this run wrote
+        record_manifest("configs", router_digests(model, allocator, args.renderer), all_routers, removed,
+                        lambda router: config_path(router, "configs"))
     print(f"Generated {len(all_routers)} config files in 'configs' directory")
+    if removed:
+        print(f"Routers no longer in the intent (configs moved to configs/{REMOVED_DIR}): " + ", ".join(removed))
+
+def _instrumented(args, stages):
+    """
+    Run stages with the statistics and profiling asked on the command line
+    """
+    STATS.enabled = args.stats or bool(args.profile)
+    with profiled(args.profile):
+        for stage in stages:
+            stage()
+    if STATS.enabled:
+        print("\n".join(STATS.summary()))
+
+def main(argv=None):
+    """
+    Main function to generate config files for all routers
+    """
+    args = parse_args(argv)
+    _instrumented(args, [lambda: generate(args)])
+
+def run(argv=None):
+    """
+    Whole pipeline: generate the configs, summarise the interfaces and draw the
+    topology, timing each stage with --stats and profiling it with --profile
+    """
+    # the summary and graph modules are only loaded when the pipeline goes that far
+    from addresses import get_address_file
+    from create_graph import run_network_visualization
+
+    args = parse_args(argv)
+    def summarize():
+        with STATS.timer("stage get_address_file"):
+            get_address_file()
+    def draw():
+        with STATS.timer("stage run_network_visualization"):
+            run_network_visualization("intent.json", "interface_summary.db")
+    _instrumented(args, [lambda: generate(args), summarize, draw])
 
 if __name__ == "__main__":
-    main()
-    get_address_file()
-    run_network_visualization("intent.json", "interface_summary.txt")
\ No newline at end of file
+    run()
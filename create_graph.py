@@ -1,134 +1,458 @@
-import json 
+import argparse
+import hashlib
+import json
 import os
-import networkx as nx
-import matplotlib.pyplot as plt
+import sys
+from xml.sax.saxutils import escape
+
+from addresses import open_summary_db
+from fileutils import atomic_write
+
+# networkx and matplotlib are imported inside the functions that use them, so
+# that importing this module (e.g. for topology_hash) stays cheap
 
 json_name_file = 'intent.json'
 txt_path = 'interface_summary.txt'
-def run_network_visualization(json_file, txt_file, output_file=None):
+
+# graphs up to this many nodes use the (cubic) Kamada-Kawai layout
+KAMADA_KAWAI_MAX_NODES = 300
+# graphs up to this many nodes use the spring layout when Graphviz sfdp is not available
+SPRING_MAX_NODES = 2000
+# default directory of the cached node positions
+LAYOUT_CACHE_DIR = '.layout_cache'
+
+
+# Extract router name from a link endpoint string
+def extract_router_name(endpoint):
+    parts = endpoint.split(':')
+    if len(parts) > 2:
+        return parts[1]
+    else:
+        return parts[0]
+
+# Extract loopback interfaces from the interface summary file
+def get_local_interfaces(file_path):
+    if file_path.endswith('.db'):
+        # structured summary written by addresses.write_summary_db: no text parsing needed
+        conn = open_summary_db(file_path)
+        try:
+            rows = conn.execute("SELECT router, ip FROM interfaces WHERE interface = 'Loopback0'")
+            return {router: ip for router, ip in rows if ip}
+        finally:
+            conn.close()
+    loopback_addresses = dict()
+    with open(file_path, 'r') as file:
+        current_router = None
+        for line in file:
+            line = line.strip()
+            if line.startswith("Router:"):
+                current_router = line.split()[1]
+            elif "Loopback0" in line:
+                loopback_ip = line.split("IP:")[1].split()[0]
+                loopback_addresses[current_router] = loopback_ip
+    return loopback_addresses
+
+# Extract a unique list of router names from the links data
+def get_list_router_name(links):
+    router_names = set()
+    for link in links:
+        router_names.add(extract_router_name(link["from"]))
+        router_names.add(extract_router_name(link["to"]))
+    return list(router_names)
+
+# Create a list of edges (source, target) from the links data
+def add_edges_to_graph(links):
+    list_edge = set()
+    for link in links:
+        source = extract_router_name(link["from"])
+        target = extract_router_name(link["to"])
+        list_edge.add((source, target))
+    return list(list_edge)
+
+def build_topology_graph(json_file, txt_file=None):
+    """
+    Build the router graph of an intent, with loopback IPs as node attributes
+
+    Args:
+        json_file (str): Path to the JSON file containing network topology data
+        txt_file (str, optional): Path to the interface summary (text file or its SQLite copy);
+            without it the nodes carry no loopback attribute
+    """
+    import networkx as nx
+
+    with open(json_file, 'r') as f:
+        intent_data = json.load(f)
+
+    links = intent_data["network"]["service_provider"]["links"]
+    loopback_addresses = get_local_interfaces(txt_file) if txt_file else {}
+
+    # Create graph
+    G = nx.Graph()
+
+    # Add nodes (routers)
+    G.add_nodes_from(get_list_router_name(links))
+
+    # Add loopback IPs as node attributes
+    for router, loopback in loopback_addresses.items():
+        if router in G.nodes:
+            G.nodes[router]['loopback'] = loopback
+
+    # Add edges (connections between routers)
+    G.add_edges_from(add_edges_to_graph(links))
+    return G, loopback_addresses
+
+def choose_layout(G):
+    """
+    Pick a layout algorithm from the size of the graph
+
+    Kamada-Kawai gives the best spacing but is cubic in the node count, so
+    larger graphs use Graphviz sfdp when pygraphviz is installed. Without it,
+    medium graphs use the force-directed spring layout and very large ones
+    the spectral layout (a sparse eigenvector computation).
+    """
+    if G.number_of_nodes() <= KAMADA_KAWAI_MAX_NODES:
+        return 'kamada_kawai'
+    try:
+        import pygraphviz  # noqa: F401
+        return 'sfdp'
+    except ImportError:
+        return 'spring' if G.number_of_nodes() <= SPRING_MAX_NODES else 'spectral'
+
+def topology_hash(G, layout):
+    """
+    Hash of the nodes, edges and layout name, used as the key of the position cache
+    """
+    edges = sorted(tuple(sorted(map(str, edge))) for edge in G.edges())
+    data = json.dumps([layout, sorted(map(str, G.nodes())), edges], separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def compute_layout(G, layout='auto', cache_dir=LAYOUT_CACHE_DIR):
+    """
+    Compute (or load from the disk cache) the node positions of a graph
+
+    Args:
+        G (nx.Graph): topology graph
+        layout (str): 'auto', 'kamada_kawai', 'spring', 'spectral' or 'sfdp'
+        cache_dir (str, optional): directory of the position cache, None to disable it
+
+    Returns:
+        dict: node -> (x, y)
+    """
+    if layout == 'auto':
+        layout = choose_layout(G)
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, f"{topology_hash(G, layout)}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                return {node: tuple(coords) for node, coords in json.load(f).items()}
+
+    import networkx as nx
+
+    if G.number_of_nodes() == 0:
+        pos = {}
+    elif layout == 'kamada_kawai':
+        pos = nx.kamada_kawai_layout(G)
+    elif layout == 'sfdp':
+        pos = nx.nx_agraph.graphviz_layout(G, prog='sfdp')
+    elif layout == 'spring':
+        pos = nx.spring_layout(G, seed=42)
+    elif layout == 'spectral':
+        pos = nx.spectral_layout(G)
+    else:
+        raise ValueError(f"unknown layout '{layout}'")
+    pos = {node: (float(coords[0]), float(coords[1])) for node, coords in pos.items()}
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_write(cache_file) as f:
+            json.dump(pos, f)
+    return pos
+
+def _scaled_positions(pos, size):
+    """
+    Map layout coordinates onto a size x size canvas (y axis pointing down)
+    """
+    if not pos:
+        return {}
+    xs = [x for x, _ in pos.values()]
+    ys = [y for _, y in pos.values()]
+    min_x, min_y = min(xs), min(ys)
+    span = max(max(xs) - min_x, max(ys) - min_y) or 1.0
+    margin = size * 0.05
+    scale = (size - 2 * margin) / span
+    return {
+        node: (margin + (x - min_x) * scale, size - margin - (y - min_y) * scale)
+        for node, (x, y) in pos.items()
+    }
+
+def _svg_document(G, pos):
+    """
+    Render the graph as a standalone SVG document.
+
+    All edges go into a single <path> element and labels are only drawn for
+    graphs small enough to read them, so the document stays compact at 10k nodes.
+    """
+    n = G.number_of_nodes()
+    size = max(1000, int(60 * n ** 0.5))
+    coords = _scaled_positions(pos, size)
+    radius = 12 if n <= KAMADA_KAWAI_MAX_NODES else 3
+    labels = n <= SPRING_MAX_NODES
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size}" height="{size}" font-family="sans-serif">',
+        '<title>Network Topology Graph</title>',
+    ]
+    path = ''.join(
+        f"M{coords[a][0]:.1f} {coords[a][1]:.1f}L{coords[b][0]:.1f} {coords[b][1]:.1f}"
+        for a, b in G.edges()
+    )
+    parts.append(f'<path d="{path}" stroke="gray" stroke-width="1" fill="none"/>')
+    parts.append('<g fill="skyblue" stroke="steelblue">')
+    for node, (x, y) in coords.items():
+        loopback = G.nodes[node].get('loopback', '')
+        tooltip = escape(f"{node} {loopback}".strip())
+        parts.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{radius}"><title>{tooltip}</title></circle>')
+    parts.append('</g>')
+    if labels:
+        parts.append('<g font-size="10" text-anchor="middle">')
+        for node, (x, y) in coords.items():
+            parts.append(f'<text x="{x:.1f}" y="{y + 4:.1f}" font-weight="bold">{escape(str(node))}</text>')
+            loopback = G.nodes[node].get('loopback')
+            if loopback:
+                parts.append(f'<text x="{x:.1f}" y="{y + radius + 12:.1f}" font-size="8" fill="red">{escape(loopback)}</text>')
+        parts.append('</g>')
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+_HTML_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Network Topology Graph</title>
+<style>html, body {{ margin: 0; height: 100%; overflow: hidden; }} svg {{ width: 100%; height: 100%; cursor: grab; }}</style>
+</head>
+<body>
+{svg}
+<script>
+// wheel to zoom around the pointer, drag to pan: only the viewBox changes
+const svg = document.querySelector('svg');
+svg.removeAttribute('width');
+svg.removeAttribute('height');
+let box = svg.viewBox.baseVal;
+let drag = null;
+svg.addEventListener('wheel', e => {{
+  e.preventDefault();
+  const k = e.deltaY > 0 ? 1.2 : 1 / 1.2;
+  const r = svg.getBoundingClientRect();
+  const px = box.x + (e.clientX - r.left) / r.width * box.width;
+  const py = box.y + (e.clientY - r.top) / r.height * box.height;
+  box.x = px - (px - box.x) * k; box.y = py - (py - box.y) * k;
+  box.width *= k; box.height *= k;
+}});
+svg.addEventListener('mousedown', e => {{ drag = [e.clientX, e.clientY]; }});
+window.addEventListener('mouseup', () => {{ drag = null; }});
+window.addEventListener('mousemove', e => {{
+  if (!drag) return;
+  const r = svg.getBoundingClientRect();
+  box.x -= (e.clientX - drag[0]) / r.width * box.width;
+  box.y -= (e.clientY - drag[1]) / r.height * box.height;
+  drag = [e.clientX, e.clientY];
+}});
+</script>
+</body>
+</html>
+"""
+
+def _dot_id(value):
+    # quoted DOT id; backslashes are kept so that the \n escapes of labels stay line breaks
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+EXPORT_FORMATS = ('json', 'graphml', 'dot', 'svg', 'html')
+
+def export_topology(G, pos, output_file, fmt=None):
+    """
+    Write the graph and its layout without going through matplotlib
+
+    Args:
+        G (nx.Graph): topology graph (loopbacks as 'loopback' node attributes)
+        pos (dict): node -> (x, y)
+        output_file (str): file to write
+        fmt (str, optional): one of EXPORT_FORMATS, taken from the file extension by default
+    """
+    fmt = fmt or os.path.splitext(output_file)[1].lstrip('.').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format '{fmt}' (expected one of {', '.join(EXPORT_FORMATS)})")
+
+    if fmt == 'graphml':
+        import networkx as nx
+
+        H = G.copy()
+        for node, (x, y) in pos.items():
+            H.nodes[node]['x'] = x
+            H.nodes[node]['y'] = y
+        nx.write_graphml(H, output_file)
+        return output_file
+
+    with open(output_file, 'w') as f:
+        if fmt == 'json':
+            json.dump({
+                "nodes": [
+                    {"id": node, "loopback": G.nodes[node].get('loopback'),
+                     "x": pos[node][0], "y": pos[node][1]}
+                    for node in G.nodes()
+                ],
+                "links": [{"source": a, "target": b} for a, b in G.edges()],
+            }, f)
+        elif fmt == 'dot':
+            f.write("graph topology {\n")
+            for node in G.nodes():
+                x, y = pos[node]
+                label = f"{node}\\n{G.nodes[node]['loopback']}" if 'loopback' in G.nodes[node] else str(node)
+                f.write(f'  {_dot_id(node)} [label={_dot_id(label)}, pos="{x:.4f},{y:.4f}!"];\n')
+            for a, b in G.edges():
+                f.write(f"  {_dot_id(a)} -- {_dot_id(b)};\n")
+            f.write("}\n")
+        elif fmt == 'svg':
+            f.write(_svg_document(G, pos))
+        else:
+            f.write(_HTML_TEMPLATE.format(svg=_svg_document(G, pos)))
+    return output_file
+
+def _inputs_exist(json_file, txt_file):
+    """
+    Check the intent and interface summary files, printing an error for a missing one
+    """
+    if not os.path.exists(json_file):
+        print(f"Error: JSON file '{json_file}' not found.")
+        return False
+    if not os.path.exists(txt_file):
+        print(f"Error: Interface summary file '{txt_file}' not found.")
+        return False
+    return True
+
+def export_network_topology(json_file, txt_file, output_file, fmt=None,
+                            layout='auto', cache_dir=LAYOUT_CACHE_DIR):
+    """
+    Build the topology graph of an intent and export it (JSON, GraphML, DOT, SVG or HTML)
+
+    Uses the same graph and cached layout as run_network_visualization, but
+    never creates matplotlib artists, so it scales to very large fabrics.
+
+    Returns:
+        str: output_file, or None if an input file is missing
+    """
+    if not _inputs_exist(json_file, txt_file):
+        return None
+    G, _ = build_topology_graph(json_file, txt_file)
+    pos = compute_layout(G, layout, cache_dir)
+    export_topology(G, pos, output_file, fmt)
+    print(f"Topology exported to {output_file}")
+    return output_file
+
+def run_network_visualization(json_file, txt_file, output_file=None, headless=False,
+                              layout='auto', cache_dir=LAYOUT_CACHE_DIR):
     """
     Run the network visualization program with the specified input files.
-    
+
     Args:
         json_file (str): Path to the JSON file containing network topology data
-        txt_file (str): Path to the text file containing interface summary data
+        txt_file (str): Path to the interface summary, either the text file or its SQLite copy (.db)
         output_file (str, optional): Path to save the visualization image
+        headless (bool): render with the Agg backend and never open a window
+            (the image goes to output_file, 'network_topology.png' by default)
+        layout (str): 'auto' (chosen from the graph size), 'kamada_kawai', 'spring', 'spectral' or 'sfdp'
+        cache_dir (str, optional): directory where node positions are cached, None to disable
     """
     try:
         # Check if input files exist
-        if not os.path.exists(json_file):
-            print(f"Error: JSON file '{json_file}' not found.")
+        if not _inputs_exist(json_file, txt_file):
             return False
-            
-        if not os.path.exists(txt_file):
-            print(f"Error: Interface summary file '{txt_file}' not found.")
-            return False
-        
-        # Import necessary libraries
-        import json
+
         import networkx as nx
         import matplotlib.pyplot as plt
-        
-        # Extract router name from a link endpoint string
-        def extract_router_name(endpoint):
-            parts = endpoint.split(':')
-            if len(parts) > 2:
-                return parts[1]
-            else:
-                return parts[0]
-        
-        # Extract loopback interfaces from the interface summary file
-        def get_local_interfaces(file_path):
-            loopback_addresses = dict()
-            with open(file_path, 'r') as file:
-                current_router = None
-                for line in file:
-                    line = line.strip()
-                    if line.startswith("Router:"):
-                        current_router = line.split()[1]
-                    elif "Loopback0" in line:
-                        loopback_ip = line.split("IP:")[1].split()[0]
-                        loopback_addresses[current_router] = loopback_ip
-            return loopback_addresses
-        
-        # Extract a unique list of router names from the links data
-        def get_list_router_name(links):
-            router_names = set()
-            for link in links:
-                router_names.add(extract_router_name(link["from"]))
-                router_names.add(extract_router_name(link["to"]))
-            return list(router_names)
-        
-        # Create a list of edges (source, target) from the links data
-        def add_edges_to_graph(links):
-            list_edge = set()
-            for link in links:
-                source = extract_router_name(link["from"])
-                target = extract_router_name(link["to"])
-                list_edge.add((source, target))
-            return list(list_edge)
-        
-        # Load data
-        with open(json_file, 'r') as f:
-            intent_data = json.load(f)
-        
-        links = intent_data["network"]["service_provider"]["links"]
-        loopback_addresses = get_local_interfaces(txt_file)
-        
-        # Create graph
-        G = nx.Graph()
-        
-        # Add nodes (routers)
-        list_routeurs_name = get_list_router_name(links)
-        G.add_nodes_from(list_routeurs_name)
-        
-        # Add loopback IPs as node attributes
-        for router, loopback in loopback_addresses.items():
-            if router in G.nodes:
-                G.nodes[router]['loopback'] = loopback
-        
-        # Add edges (connections between routers)
-        list_edge = add_edges_to_graph(links)
-        G.add_edges_from(list_edge)
-        
+
+        if headless:
+            plt.switch_backend('Agg')
+            output_file = output_file or 'network_topology.png'
+
+        G, loopback_addresses = build_topology_graph(json_file, txt_file)
+
         print("Loopback addresses:", loopback_addresses)
-        
+
         # Visualization
         plt.figure(figsize=(12, 8))
-        
-        # Use Kamada-Kawai layout for better node spacing
-        pos = nx.kamada_kawai_layout(G)
-        
+
+        # Kamada-Kawai for small graphs, a force-directed layout for large ones
+        pos = compute_layout(G, layout, cache_dir)
+
+        # shrink nodes and drop labels when there are too many routers to read them
+        large = G.number_of_nodes() > KAMADA_KAWAI_MAX_NODES
+
         # Draw nodes and edges
-        nx.draw(G, pos, with_labels=True, node_color='skyblue', 
-                node_size=1000, edge_color='gray', font_size=10, 
-                font_weight='bold')
-        
-        # Create offset positions for loopback labels
-        loopback_labels = nx.get_node_attributes(G, 'loopback')
-        loopback_pos = {node: (coords[0], coords[1] - 0.08) for node, coords in pos.items()}
-        
-        # Draw loopback IP labels
-        nx.draw_networkx_labels(G, loopback_pos, labels=loopback_labels, 
-                            font_size=8, font_color='red', 
-                            bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, pad=2))
-        
+        nx.draw(G, pos, with_labels=not large, node_color='skyblue',
+                node_size=20 if large else 1000, edge_color='gray', font_size=10,
+                font_weight='bold', width=0.3 if large else 1.0)
+
+        if not large:
+            # Create offset positions for loopback labels
+            loopback_labels = nx.get_node_attributes(G, 'loopback')
+            loopback_pos = {node: (coords[0], coords[1] - 0.08) for node, coords in pos.items()}
+
+            # Draw loopback IP labels
+            nx.draw_networkx_labels(G, loopback_pos, labels=loopback_labels,
+                                font_size=8, font_color='red',
+                                bbox=dict(facecolor='white', edgecolor='none', alpha=0.7, pad=2))
+
         plt.title("Network Topology Graph")
         plt.tight_layout()
-        
+
         # Save the figure if output file is specified
         if output_file:
             plt.savefig(output_file, dpi=300, bbox_inches='tight')
             print(f"Visualization saved to {output_file}")
-        
+
         # Display the visualization
-        plt.show()
-        
+        if headless:
+            plt.close()
+        else:
+            plt.show()
+
         return True
-    
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return False
 
 
-#run_network_visualization(json_name_file, txt_path, output_file='network_topology.png')
\ No newline at end of file
+def main(argv=None):
+    """
+    Draw or export the topology of an intent
+    """
+    parser = argparse.ArgumentParser(description="Draw the router topology of an intent")
+    parser.add_argument("intent", nargs="?", default=json_name_file, help="intent file")
+    parser.add_argument("summary", nargs="?", default="interface_summary.db",
+                        help="interface summary (text file or SQLite copy) giving the loopbacks")
+    parser.add_argument("--output", help="image to save, or exported file with --export")
+    parser.add_argument("--headless", action="store_true", help="render with Agg and never open a window")
+    parser.add_argument("--export", choices=EXPORT_FORMATS,
+                        help="export the graph instead of drawing it with matplotlib")
+    parser.add_argument("--layout", default="auto",
+                        help="'auto', 'kamada_kawai', 'spring', 'spectral' or 'sfdp'")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the layout cache")
+    args = parser.parse_args(argv)
+    cache_dir = None if args.no_cache else LAYOUT_CACHE_DIR
+    if args.export:
+        exported = export_network_topology(args.intent, args.summary,
+                                           args.output or f"network_topology.{args.export}",
+                                           args.export, args.layout, cache_dir)
+        return 0 if exported else 1
+    ok = run_network_visualization(args.intent, args.summary, args.output, args.headless, args.layout, cache_dir)
+    return 0 if ok else 1
+
+
+#run_network_visualization(json_name_file, txt_path, output_file='network_topology.png')
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,13 @@
+import argparse
+import hashlib
+import json
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
-# Dictionary mapping router number to its folder ID and router name
+from fileutils import atomic_write
+
+# Dictionary mapping router number (used when no GNS3 project file is given) to its folder ID and router name
 router_folder_corresp = {
     5 : ("8936d624-47db-464e-8324-7850715336a4", "i5"),
     1 : ("0908260c-1447-42d4-8572-70b6cd9be6e9", "i1"),
@@ -20,17 +26,26 @@ router_folder_corresp = {
 config_folder = "configs"
 # Destination folder where GNS3 expects the configuration files to be moved
 destination = "/home/srmili/Bureau/NAS_proj_new/project-files/dynamips"
+# Cache of the node index of a GNS3 project, written next to the .gns3 file
+NODE_INDEX_CACHE = ".gns3_node_index.json"
+# Folder (inside each router folder) holding the NVRAM and old .cfg files until every router is deployed
+BACKUP_DIR = ".deploy_backup"
 
 
-def delete_existing_cfg_files(dest_folder):
+def delete_existing_cfg_files(dest_folder, keep=None):
     """
     Deletes all .cfg files from the destination folder (if they exist).
     This is to avoid conflicts with existing configurations before moving the new ones.
+
+    Args:
+        keep (str, optional): path of a .cfg file to leave in place (the config just deployed)
     """
     if os.path.exists(dest_folder):
         for file in os.listdir(dest_folder):
             if file.endswith(".cfg"):   # Filter to only .cfg files
                 file_path = os.path.join(dest_folder, file)
+                if keep and os.path.abspath(file_path) == os.path.abspath(keep):
+                    continue
                 os.remove(file_path)    # Remove the file
                 print(f"Deleted existing .cfg file: {file_path}")
 
@@ -48,34 +63,299 @@ def delete_nvram_file(router_folder):
                 print(f"Deleted NVRAM file: {file_path}")
 
 
-def move_configs():
+def file_hash(path):
     """
-    This function moves configuration files from the source folder to the appropriate destination folder
-    based on the router folder and router number mapping provided in 'router_folder_corresp'.
-    It also handles the deletion of existing configuration and NVRAM files as needed.
+    SHA-256 of a file's content
     """
-    # Iterate over each router in the mapping dictionary
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def deployment_plan():
+    """
+    List the (source file, router folder, destination file) of every router in 'router_folder_corresp'
+    """
+    plan = []
     for router_number, (folder_id, router_name) in router_folder_corresp.items():
         router_folder = os.path.join(destination, folder_id)  # Router's main folder path
         dest_folder = os.path.join(router_folder, "configs")  # Path to the 'configs' subfolder
         src_file = os.path.join(config_folder, f"R{router_number}_startup-config.cfg")  # Source config file
         dest_file = os.path.join(dest_folder, f"{router_name}_startup-config.cfg") # Destination config file with router's local ID
+        plan.append((src_file, router_folder, dest_file))
+    return plan
+
+
+def _read_node_index(project_file):
+    """
+    Build node name -> (node_id, dynamips file prefix 'i<N>') from a .gns3 project file
+    """
+    with open(project_file) as f:
+        project = json.load(f)
+    index = {}
+    for node in project.get("topology", {}).get("nodes", []):
+        dynamips_id = node.get("properties", {}).get("dynamips_id")
+        if node.get("node_type") == "dynamips" and dynamips_id is not None:
+            index[node["name"]] = (node["node_id"], f"i{dynamips_id}")
+    return index
+
+
+# in-process cache of the node indexes: project file -> (mtime, index)
+_node_index_cache = {}
+
+def load_node_index(project_file):
+    """
+    Return the node name -> (node_id, 'i<N>') index of a GNS3 project
+
+    The index is cached in memory and in '.gns3_node_index.json' next to the
+    project, and only rebuilt when the mtime of the .gns3 file changes.
+    """
+    mtime = os.stat(project_file).st_mtime_ns
+    cached = _node_index_cache.get(project_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    cache_file = os.path.join(os.path.dirname(os.path.abspath(project_file)), NODE_INDEX_CACHE)
+    index = None
+    if os.path.exists(cache_file):
+        with open(cache_file) as f:
+            data = json.load(f)
+        if data.get("mtime") == mtime and data.get("project") == os.path.abspath(project_file):
+            index = {name: tuple(entry) for name, entry in data["nodes"].items()}
+    if index is None:
+        index = _read_node_index(project_file)
+        with atomic_write(cache_file) as f:
+            json.dump({"project": os.path.abspath(project_file), "mtime": mtime, "nodes": index}, f)
+    _node_index_cache[project_file] = (mtime, index)
+    return index
+
+
+def node_config_file(project_file, router):
+    """
+    Return (router folder, startup-config file) of a router in a GNS3 project, or None
+    if the project has no dynamips node with that name
+    """
+    entry = load_node_index(project_file).get(router)
+    if entry is None:
+        return None
+    node_id, file_prefix = entry
+    router_folder = os.path.join(os.path.dirname(os.path.abspath(project_file)), "project-files", "dynamips", node_id)
+    return router_folder, os.path.join(router_folder, "configs", f"{file_prefix}_startup-config.cfg")
+
+
+def project_deployment_plan(project_file):
+    """
+    List the (source file, router folder, destination file) of every generated config,
+    locating each router in a GNS3 project by its node name
+    """
+    plan = []
+    for file in sorted(os.listdir(config_folder)):
+        if not file.endswith("_startup-config.cfg"):
+            continue
+        router = file.split("_")[0]
+        location = node_config_file(project_file, router)
+        if location is None:
+            print(f"No GNS3 node named {router} in {project_file}, skipped")
+            continue
+        router_folder, dest_file = location
+        plan.append((os.path.join(config_folder, file), router_folder, dest_file))
+    return plan
+
+
+def staging_path(dest_file):
+    # hidden and without the .cfg extension, so GNS3 and replaced_files ignore it
+    folder, name = os.path.split(dest_file)
+    return os.path.join(folder, f".{name}.staging")
+
+
+def stage_config(src_file, dest_file):
+    """
+    Copy a config next to its destination, unless the deployed config already has the same content
+
+    Returns:
+        str: 'missing', 'unchanged' or 'staged'
+    """
+    if not os.path.exists(src_file):
+        return "missing"
+    if os.path.exists(dest_file) and file_hash(dest_file) == file_hash(src_file):
+        return "unchanged"
+    os.makedirs(os.path.dirname(dest_file), exist_ok=True)    # Create the destination folder if it doesn't exist
+    shutil.copyfile(src_file, staging_path(dest_file))
+    return "staged"
 
-        # Delete NVRAM file in the router's main folder before moving the new config file
-        delete_nvram_file(router_folder)
 
-        # Delete any existing .cfg files in the destination config folder to avoid conflicts
-        if os.path.exists(dest_folder):
-            delete_existing_cfg_files(dest_folder)
+def replaced_files(router_folder, dest_file):
+    """
+    Files the deployment of a router replaces: its NVRAM files and the .cfg
+    files next to its config (including the deployed config itself)
+    """
+    paths = []
+    if os.path.exists(router_folder):
+        paths += [os.path.join(router_folder, file) for file in sorted(os.listdir(router_folder)) if "nvram" in file]
+    dest_folder = os.path.dirname(dest_file)
+    if os.path.exists(dest_folder):
+        paths += [os.path.join(dest_folder, file) for file in sorted(os.listdir(dest_folder)) if file.endswith(".cfg")]
+    return [path for path in dict.fromkeys(paths) if os.path.isfile(path)]
+
+
+def install_config(router_folder, dest_file, moves):
+    """
+    Put a staged config in place without deleting anything: the NVRAM and old
+    .cfg files are moved to BACKUP_DIR first, then the staged file is renamed.
+
+    Args:
+        moves (list): filled with the (original, backup) paths as files are moved,
+            so a failure halfway can still be rolled back
+    """
+    for path in replaced_files(router_folder, dest_file):
+        backup_dir = os.path.join(os.path.dirname(path), BACKUP_DIR)
+        os.makedirs(backup_dir, exist_ok=True)
+        backup = os.path.join(backup_dir, os.path.basename(path))
+        os.replace(path, backup)
+        moves.append((path, backup))
+    os.replace(staging_path(dest_file), dest_file)
+
+
+def restore_router(dest_file, moves, installed):
+    """
+    Undo install_config(): take the new config out and move the backups back
+
+    Returns:
+        list: files that could not be restored
+    """
+    failed = []
+    try:
+        if installed:
+            os.replace(dest_file, staging_path(dest_file))
+        if os.path.exists(staging_path(dest_file)):
+            os.remove(staging_path(dest_file))
+    except OSError as e:
+        failed.append(f"{dest_file}: {e}")
+    for original, backup in reversed(moves):
+        try:
+            os.replace(backup, original)
+        except OSError as e:
+            failed.append(f"{original}: {e}")
+    return failed
+
+
+def drop_backups(src_file, dest_file, moves, keep_source):
+    """
+    Delete the backups of a deployed router (the old NVRAM and .cfg files) and its source config
+    """
+    for original, backup in moves:
+        os.remove(backup)
+        if original == dest_file:
+            continue # the previous version of the deployed config
+        kind = "NVRAM file" if "nvram" in os.path.basename(original) else "existing .cfg file"
+        print(f"Deleted {kind}: {original}")
+    for backup_dir in dict.fromkeys(os.path.dirname(backup) for _, backup in moves):
+        if not os.listdir(backup_dir):
+            os.rmdir(backup_dir)
+    if not keep_source:
+        os.remove(src_file)
+    print(f"Moved {src_file} to {dest_file}")
+
+
+def move_configs(jobs=8, keep_source=False, plan=None, project_file=None):
+    """
+    This function moves configuration files from the source folder to the appropriate destination folder
+    based on the router folder and router number mapping provided in 'router_folder_corresp'.
+
+    The deployment is all-or-nothing, with every step until the last one reversible:
+    1. every changed config is copied to a staging file next to its destination
+       (concurrently, over a thread pool);
+    2. for each router, its NVRAM and old .cfg files are moved to BACKUP_DIR and
+       the staged file is renamed into place;
+    3. only once every router has done step 2 are the backups deleted.
+    If step 1 or 2 fails for any router, the new configs are taken out and the
+    backups moved back for every router, leaving the lab as it was. Configs
+    whose content matches the deployed one are skipped, so those routers keep
+    their NVRAM.
+
+    Args:
+        jobs (int): number of threads for the per-router file operations
+        keep_source (bool): copy instead of move (leave the generated configs in place)
+        plan (list, optional): (source file, router folder, destination file) tuples
+        project_file (str, optional): GNS3 .gns3 project whose nodes are discovered by name;
+            without it the hard-coded 'router_folder_corresp' mapping is used
+
+    Returns:
+        dict: 'deployed', 'unchanged' and 'missing' lists of source files
+    """
+    if plan is None:
+        plan = project_deployment_plan(project_file) if project_file else deployment_plan()
+    result = {"deployed": [], "unchanged": [], "missing": []}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(stage_config, src_file, dest_file) for src_file, _, dest_file in plan]
+        statuses = []
+        errors = []
+        for (src_file, _, dest_file), future in zip(plan, futures):
+            try:
+                statuses.append(future.result())
+            except OSError as e:
+                statuses.append("failed")
+                errors.append(f"{src_file}: {e}")
+
+        staged = [entry for entry, status in zip(plan, statuses) if status == "staged"]
+        if errors:
+            # roll back: nothing has been deleted or replaced yet
+            for _, _, dest_file in staged:
+                if os.path.exists(staging_path(dest_file)):
+                    os.remove(staging_path(dest_file))
+            raise RuntimeError("Deployment aborted, no router was changed:\n" + "\n".join(errors))
+
+        for (src_file, _, dest_file), status in zip(plan, statuses):
+            if status == "missing":
+                print(f"Source file not found: {src_file}")
+                result["missing"].append(src_file)
+            elif status == "unchanged":
+                print(f"Unchanged, skipped: {dest_file}")
+                result["unchanged"].append(src_file)
+
+        moves = {dest_file: [] for _, _, dest_file in staged}
+        futures = [pool.submit(install_config, router_folder, dest_file, moves[dest_file])
+                   for _, router_folder, dest_file in staged]
+        installed = {}
+        for (src_file, _, dest_file), future in zip(staged, futures):
+            try:
+                future.result()
+                installed[dest_file] = True
+            except OSError as e:
+                installed[dest_file] = False
+                errors.append(f"{src_file}: {e}")
+        if errors:
+            failed = []
+            for _, _, dest_file in staged:
+                failed += restore_router(dest_file, moves[dest_file], installed[dest_file])
+            if failed:
+                raise RuntimeError("Deployment aborted, some files could not be restored:\n"
+                                   + "\n".join(errors + failed))
+            raise RuntimeError("Deployment aborted, every router was restored:\n" + "\n".join(errors))
+
+        # every router runs its new config: the old files are no longer needed
+        list(pool.map(lambda entry: drop_backups(entry[0], entry[2], moves[entry[2]], keep_source), staged))
+        result["deployed"] = [src_file for src_file, _, _ in staged]
+    return result
+
+def main(argv=None):
+    """
+    Deploy the generated configs to the GNS3 project
+    """
+    parser = argparse.ArgumentParser(description="Deploy the generated configs to the GNS3 routers")
+    parser.add_argument("project", nargs="?",
+                        help="GNS3 .gns3 project file to discover the router folders from "
+                             "(default: the 'router_folder_corresp' mapping)")
+    parser.add_argument("--jobs", "-j", type=int, default=8, help="threads used for the file operations (default: 8)")
+    parser.add_argument("--keep-source", action="store_true", help="copy the configs instead of moving them")
+    args = parser.parse_args(argv)
+    result = move_configs(jobs=args.jobs, keep_source=args.keep_source, project_file=args.project)
+    print(f"{len(result['deployed'])} deployed, {len(result['unchanged'])} unchanged, "
+          f"{len(result['missing'])} missing")
+    return 0
 
-        # Move the new configuration file from the source to the destination folder
-        if os.path.exists(src_file):
-            if not os.path.exists(dest_folder):
-                os.makedirs(dest_folder)    # Create the destination folder if it doesn't exist
-            shutil.move(src_file, dest_file)    # Move the config file to the destination
-            print(f"Moved {src_file} to {dest_file}")
-        else:
-            print(f"Source file not found: {src_file}")
 
 if __name__ == "__main__":
-    move_configs()  # Call the function to start moving the config files
\ No newline at end of file
+    main()  # Call the function to start moving the config files
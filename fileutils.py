@@ -0,0 +1,32 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    Yield a unique temporary path next to `path`; when the with block ends
+    normally the temporary file replaces `path`, otherwise it is removed.
+
+    Readers never see a half-written file, and concurrent writers (pool
+    workers, two runs at once) never share a temporary file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def atomic_write(path, mode="w", buffering=-1):
+    """
+    Open a file that atomically replaces `path` once the with block succeeds
+    """
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, mode.replace("w", "x"), buffering=buffering) as f:
+            yield f
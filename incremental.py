@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+
+from fileutils import atomic_write
+
+MANIFEST_NAME = ".manifest.json"
+# configs of routers removed from the intent are moved here, inside the output directory
+REMOVED_DIR = ".removed"
+
+
+def router_inputs(router, model, allocator):
+    """
+    Collect the slice of the intent and of the allocator state that the config
+    of a router is rendered from.
+
+    Two runs that give the same inputs for a router render the same config,
+    so the digest of this dict tells whether the config must be rewritten.
+    """
+    if model.is_ce(router):
+        peer = model.peer_by_ce[router]
+        return {
+            "router": router,
+            "role": "CE",
+            "platform": model.platform(router),
+            "sp_asn": model.asn,
+            "customer_asn": model.customer_by_ce[router]['asn'],
+            "interface": model.ce_interface.get(router),
+            "loopback": allocator.get_ce_loopback_ip(router),
+            "peer": peer,
+            "subnet": str(allocator.get_peer_subnet(router)),
+        }
+
+    inputs = {
+        "router": router,
+        "role": "PE" if model.is_pe(router) else "P",
+        "platform": model.platform(router),
+        "loopback": allocator.get_sp_loopback_ip(router),
+        "core_links": [
+            [local_intf, peer_router,
+             [str(ip) for ip in allocator.get_link_subnet(router, local_intf, peer_router, peer_intf)]]
+            for local_intf, peer_router, peer_intf in model.core_links.get(router, [])
+        ],
+    }
+    if allocator.has_ipv6:
+        inputs["loopback_v6"] = allocator.get_sp_loopback_ip_v6(router)
+        inputs["core_links_v6"] = [
+            [str(ip) for ip in allocator.get_link_subnet_v6(router, local_intf, peer_router, peer_intf)]
+            for local_intf, peer_router, peer_intf in model.core_links.get(router, [])
+        ]
+    if model.is_pe(router):
+        inputs.update({
+            "asn": model.asn,
+            "cluster_id": model.cluster_id.get(router),
+            "ibgp_peers": [
+                [peer, allocator.get_sp_loopback_ip(peer)]
+                for peer in model.ibgp_peers(router)
+            ],
+            "rr_clients": model.rr_clients.get(router, []),
+            "vrfs": [
+                [vrf, model.customer_by_vrf[vrf]['vrfs'][vrf]]
+                for vrf in model.vrfs_by_pe.get(router, [])
+            ],
+            "ebgp_peers": [
+                [pe_link, model.customer_by_vrf[pe_link['vrf']]['asn'], str(allocator.get_peer_subnet(pe_link['ce']))]
+                for pe_link in model.peers_by_pe.get(router, [])
+            ],
+        })
+    return inputs
+
+
+def input_digest(inputs, fingerprint=""):
+    """
+    Hash the inputs of a router (and the renderer fingerprint) into a hex digest
+    """
+    data = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{fingerprint}\n{data}".encode()).hexdigest()
+
+
+def file_fingerprint(*paths):
+    """
+    Hash the source files of the renderer, so that a code change invalidates every config
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """
+    Hash the content of a written config, or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest(output_dir):
+    """
+    Load the manifest of a config directory, or an empty one if there is none
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"routers": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    """
+    Write the manifest atomically next to the configs
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with atomic_write(path) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def record_manifest(output_dir, digests, changed, removed, config_path, previous=None):
+    """
+    Save the manifest of a run: the input digest of every current router and
+    the hash of its config file.
+
+    Only the files written by this run are hashed again; the others were
+    checked against the previous manifest by plan_changes().
+    """
+    files = dict((previous or {}).get("files", {}))
+    for router in changed:
+        files[router] = file_digest(config_path(router))
+    save_manifest(output_dir, {
+        "routers": digests,
+        "files": {router: files.get(router) for router in digests},
+        "changed": changed,
+        "removed": removed,
+    })
+
+
+def retire_configs(output_dir, paths):
+    """
+    Move the configs of routers that left the intent to output_dir/.removed,
+    where the tools that read output_dir (summary, diff, deploy) no longer see them
+
+    Returns:
+        list: new paths of the moved files
+    """
+    if not paths:
+        return []
+    removed_dir = os.path.join(output_dir, REMOVED_DIR)
+    os.makedirs(removed_dir, exist_ok=True)
+    moved = []
+    for path in paths:
+        target = os.path.join(removed_dir, os.path.basename(path))
+        os.replace(path, target)
+        moved.append(target)
+    return moved
+
+
+def plan_changes(routers, digests, manifest, config_path):
+    """
+    Compare the new digests with the manifest.
+
+    A router is rendered again when its inputs changed, or when its config no
+    longer has the content recorded in the manifest (missing, edited by hand,
+    or written by a run that did not record it).
+
+    Args:
+        routers (list): routers of the current intent, in generation order
+        digests (dict): router -> digest of its current inputs
+        manifest (dict): manifest of the previous run
+        config_path (callable): router -> path of its config file
+
+    Returns:
+        tuple: (routers to render, routers that are no longer in the intent)
+    """
+    previous = manifest.get("routers", {})
+    files = manifest.get("files", {})
+    changed = [
+        router for router in routers
+        if previous.get(router) != digests[router]
+        or files.get(router) is None or file_digest(config_path(router)) != files[router]
+    ]
+    removed = sorted(set(previous) - set(digests))
+    return changed, removed
@@ -0,0 +1,113 @@
+import time
+from contextlib import contextmanager
+
+
+class Stats:
+    """
+    Timings and counters of a generation run.
+
+    Timings are keyed by name ('stage render', 'section configure_bgp'...) and
+    accumulate seconds and calls; counters accumulate integers ('allocations',
+    'lines emitted', 'bytes written'). Nothing is recorded while `enabled` is False.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.timings = {} # name -> [seconds, calls]
+        self.counters = {}
+
+    def add_time(self, name, seconds, calls=1):
+        entry = self.timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a with block under `name`
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def drain(self):
+        """
+        Return the recorded timings and counters and reset them (used by pool workers)
+        """
+        snapshot = {"timings": self.timings, "counters": self.counters}
+        self.timings, self.counters = {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """
+        Add the timings and counters drained from another process
+        """
+        for name, (seconds, calls) in snapshot["timings"].items():
+            self.add_time(name, seconds, calls)
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+
+    def summary(self):
+        """
+        Lines of the summary table: timings in recording order, then counters
+        """
+        lines = [f"{'stage / section':<36} {'calls':>8} {'seconds':>10}"]
+        for name, (seconds, calls) in self.timings.items():
+            lines.append(f"{name:<36} {calls:>8} {seconds:>10.4f}")
+        if self.counters:
+            lines.append(f"{'counter':<36} {'value':>19}")
+            for name, value in self.counters.items():
+                lines.append(f"{name:<36} {value:>19}")
+        return lines
+
+
+# statistics of the current process
+STATS = Stats()
+
+
+def timed_lines(name, lines):
+    """
+    Time a section generator and count the lines it emits.
+
+    When instrumentation is on the section is drawn into a list, so the time
+    measured is that of the generator alone and not of whoever consumes it.
+    """
+    if not STATS.enabled:
+        return lines
+    start = time.perf_counter()
+    lines = list(lines)
+    STATS.add_time(f"section {name}", time.perf_counter() - start)
+    # template sections emit blocks of several lines at once
+    STATS.count("lines emitted", sum(line.count("\n") + 1 for line in lines))
+    return lines
+
+
+@contextmanager
+def profiled(path=None, limit=20):
+    """
+    Run the body of a with block under cProfile and dump the stats to `path`
+    (readable with pstats); print the `limit` most expensive functions by cumulative time.
+    Does nothing when path is None.
+    """
+    if not path:
+        yield
+        return
+    import cProfile
+    import pstats
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        pstats.Stats(path).sort_stats("cumulative").print_stats(limit)
+        print(f"Profile written to {path}")
@@ -0,0 +1,259 @@
+from collections import defaultdict, deque
+
+ROLES = ('PE', 'P', 'CE')
+DEFAULT_PLATFORM = 'ios'
+
+
+def parse_endpoint(endpoint):
+    """
+    Split a link endpoint into (router, interface, is_ce)
+
+    Endpoints look like 'R1:GigabitEthernet1/0' or 'CE:R5:GigabitEthernet1/0'.
+    """
+    if endpoint.startswith("CE:"):
+        _, router, intf = endpoint.split(':', 2)
+        return router, intf, True
+    router, intf = endpoint.split(':', 1)
+    return router, intf, False
+
+
+class CompiledIntent:
+    """
+    Indexed view of a network intent, built once so that config generators
+    look things up by router, PE, CE or VRF instead of scanning the whole intent.
+
+    The raw intent dict stays available as `raw`.
+    """
+    def __init__(self, intent):
+        self.raw = intent
+        self.sp = intent['network']['service_provider']
+        self.asn = self.sp['asn']
+        self.customers = intent['network']['customers']
+        self.ebgp_peers = intent['protocols']['bgp']['ebgp_peers']
+
+        self.pe_routers = list(self.sp['routers']['PE'])
+        self.p_routers = list(self.sp['routers']['P'])
+        self.pe_set = set(self.pe_routers)
+        self.route_reflectors = list(self.sp.get('route_reflectors', []))
+        self.sp_routers = self.pe_routers + self.p_routers
+        # CE routers in the order they first appear in the eBGP peers
+        self.ce_routers = list(dict.fromkeys(peer['ce'] for peer in self.ebgp_peers))
+        self.ce_set = set(self.ce_routers)
+        # template set used to render each role ('ios' unless the intent says otherwise)
+        platforms = intent['network'].get('platforms', {})
+        self.platforms = {role: platforms.get(role, DEFAULT_PLATFORM) for role in ROLES}
+
+        # customers by name and by VRF
+        self.customer_by_name = {cust['name']: cust for cust in self.customers}
+        self.customer_by_vrf = {}
+        for cust in self.customers:
+            for vrf in cust['vrfs']:
+                self.customer_by_vrf.setdefault(vrf, cust)
+
+        # eBGP peers by PE, by CE and by VRF
+        self.peers_by_pe = defaultdict(list)
+        self.peers_by_vrf = defaultdict(list)
+        self.peer_by_ce = {}
+        for peer in self.ebgp_peers:
+            self.peers_by_pe[peer['pe']].append(peer)
+            self.peer_by_ce.setdefault(peer['ce'], peer)
+            self.peers_by_vrf[peer['vrf']].append(peer)
+        self.customer_by_ce = {
+            ce: self.customer_by_vrf.get(peer['vrf']) for ce, peer in self.peer_by_ce.items()
+        }
+        # VRFs of each PE in the order they first appear in its peers
+        self.vrfs_by_pe = {
+            pe: list(dict.fromkeys(peer['vrf'] for peer in peers))
+            for pe, peers in self.peers_by_pe.items()
+        }
+
+        # link adjacency: core links by local router, CE interface by CE router
+        self.core_links = defaultdict(list) # router -> [(local_intf, peer_router, peer_intf)]
+        self.adjacency = defaultdict(dict) # router -> core neighbours (dict keys keep link order)
+        self.ce_interface = {}
+        for link in self.sp['links']:
+            local_router, local_intf, _ = parse_endpoint(link['from'])
+            peer_router, peer_intf, peer_is_ce = parse_endpoint(link['to'])
+            if peer_is_ce:
+                self.ce_interface.setdefault(peer_router, peer_intf)
+                continue
+            self.core_links[local_router].append((local_intf, peer_router, peer_intf))
+            self.adjacency[local_router][peer_router] = None
+            self.adjacency[peer_router][local_router] = None
+
+        self._plan_ibgp()
+
+    def _plan_ibgp(self):
+        """
+        Decide the iBGP sessions of every PE.
+
+        In the default 'full_mesh' mode every PE peers with every other PE and
+        the routers of 'route_reflectors' mark all of them as clients. In
+        'route_reflector' mode PEs are split into clusters: clients only peer
+        with the reflectors of their cluster and reflectors peer with each
+        other, so the number of sessions grows linearly with the PE count.
+        """
+        ibgp = self.sp.get('ibgp', {})
+        self.ibgp_mode = ibgp.get('mode', 'full_mesh')
+        self.cluster_id = {} # reflector -> cluster-id
+        self._ibgp_peers = {}
+        self.rr_clients = {}
+        if self.ibgp_mode == 'full_mesh':
+            for rr in self.route_reflectors:
+                self.rr_clients[rr] = [pe for pe in self.pe_routers if pe != rr]
+            return
+        if self.ibgp_mode != 'route_reflector':
+            raise ValueError(f"unknown ibgp mode '{self.ibgp_mode}' (expected 'full_mesh' or 'route_reflector')")
+
+        clusters = ibgp.get('clusters') or self._auto_clusters(ibgp.get('reflector_count', 2))
+        self.route_reflectors = list(dict.fromkeys(rr for cluster in clusters for rr in cluster['reflectors']))
+        # sessions are merged per router, so a PE found in several clusters keeps all of them
+        rr_clients = defaultdict(dict)
+        client_reflectors = defaultdict(dict)
+        for index, cluster in enumerate(clusters, start=1):
+            reflectors = list(cluster['reflectors'])
+            if not reflectors:
+                raise ValueError(f"iBGP cluster {cluster.get('id', index)} has no reflector")
+            clients = [pe for pe in cluster['clients'] if pe not in reflectors]
+            for rr in reflectors:
+                # IOS has one cluster-id per router: the first cluster of a reflector wins
+                self.cluster_id.setdefault(rr, cluster.get('id', index))
+                rr_clients[rr].update(dict.fromkeys(clients))
+            for client in clients:
+                client_reflectors[client].update(dict.fromkeys(reflectors))
+        self.rr_clients = {rr: list(clients) for rr, clients in rr_clients.items()}
+        self._ibgp_peers = {client: list(reflectors) for client, reflectors in client_reflectors.items()}
+        # reflectors peer with each other (non-client) and with their clients
+        for rr in self.route_reflectors:
+            others = [peer for peer in self.route_reflectors if peer != rr]
+            self._ibgp_peers[rr] = list(dict.fromkeys(others + self.rr_clients[rr] + self._ibgp_peers.get(rr, [])))
+
+    def _auto_clusters(self, count):
+        """
+        Split the PEs into balanced clusters served by redundant reflector pairs.
+
+        If 'route_reflectors' is set in the intent those routers are used,
+        otherwise `count` PEs are chosen. Reflectors are grouped in pairs (an
+        odd one joins a pair), so every client keeps a session when one
+        reflector of its cluster fails; the cost is twice the sessions per
+        client compared with one reflector per cluster. Only a single reflector
+        gives a cluster without redundancy.
+
+        Automatic reflectors start from one PE per cluster chosen by
+        farthest-point sampling of the core graph (from the best connected PE),
+        which spreads the clusters over the topology; the other reflectors of a
+        cluster are its clients closest to that PE. Every other PE joins the
+        nearest cluster that is not full (clusters hold at most ceil(PEs /
+        clusters) routers, ties go to the smaller cluster). Each pass is a BFS,
+        so the plan is O(count * (routers + links) + PEs * clusters).
+        """
+        reflectors = list(self.route_reflectors)
+        if reflectors:
+            size = max(1, len(reflectors) // 2)
+            groups = [reflectors[i::size] for i in range(size)]
+        elif self.pe_routers:
+            count = min(count, len(self.pe_routers))
+            size = max(1, count // 2)
+            first = max(self.pe_routers, key=lambda pe: len(self.adjacency.get(pe, ())))
+            centres = [first]
+            nearest = self._distances([first])
+            while len(centres) < size:
+                candidate = max(
+                    (pe for pe in self.pe_routers if pe not in centres),
+                    key=lambda pe: nearest.get(pe, float('inf'))
+                )
+                centres.append(candidate)
+                for router, dist in self._distances([candidate]).items():
+                    if dist < nearest.get(router, float('inf')):
+                        nearest[router] = dist
+            groups = [[centre] for centre in centres]
+        else:
+            return []
+
+        members = self._balanced_members(groups)
+        if not reflectors:
+            # the remaining reflectors of each cluster are the members closest to its first one
+            for i, (group, clients) in enumerate(zip(groups, members)):
+                wanted = count // size + (1 if i < count % size else 0)
+                dist = self._distances(group)
+                extra = sorted(clients, key=lambda pe: (dist.get(pe, float('inf')),
+                                                        -len(self.adjacency.get(pe, ()))))[:wanted - 1]
+                group += extra
+                members[i] = [pe for pe in clients if pe not in extra]
+        return [{'reflectors': group, 'clients': clients} for group, clients in zip(groups, members)]
+
+    def _balanced_members(self, groups):
+        """
+        Assign every PE that is not a reflector to the nearest reflector group
+        with room left
+
+        Returns:
+            list: the clients of each group, in PE order
+        """
+        taken = {rr for group in groups for rr in group}
+        pes = [pe for pe in self.pe_routers if pe not in taken]
+        capacity = -(-(len(pes) + len(taken)) // len(groups)) # ceil(PEs / clusters)
+        distances = [self._distances(group) for group in groups]
+        load = [len(group) for group in groups]
+        position = {pe: i for i, pe in enumerate(pes)}
+        owner = {}
+        # closest PEs pick first, so the far ones go where there is room
+        for pe in sorted(pes, key=lambda pe: (min(d.get(pe, float('inf')) for d in distances), position[pe])):
+            open_groups = [i for i in range(len(groups)) if load[i] < capacity] or range(len(groups))
+            best = min(open_groups, key=lambda i: (distances[i].get(pe, float('inf')), load[i], i))
+            owner[pe] = best
+            load[best] += 1
+        return [[pe for pe in pes if owner[pe] == i] for i in range(len(groups))]
+
+    def _distances(self, sources):
+        """
+        Hop count from the closest of `sources` to every reachable router (BFS on core links)
+        """
+        dist = {source: 0 for source in sources}
+        queue = deque(sources)
+        while queue:
+            router = queue.popleft()
+            for neighbour in self.adjacency.get(router, ()):
+                if neighbour not in dist:
+                    dist[neighbour] = dist[router] + 1
+                    queue.append(neighbour)
+        return dist
+
+    def ibgp_peers(self, router):
+        """
+        PEs a PE opens an iBGP session with
+        """
+        if self.ibgp_mode == 'full_mesh':
+            return [peer for peer in self.pe_routers if peer != router]
+        return self._ibgp_peers.get(router, [])
+
+    @property
+    def all_routers(self):
+        """
+        SP routers (PE then P) followed by CE routers
+        """
+        return self.sp_routers + self.ce_routers
+
+    def is_pe(self, router):
+        return router in self.pe_set
+
+    def is_ce(self, router):
+        return router in self.ce_set
+
+    def role(self, router):
+        if router in self.ce_set:
+            return 'CE'
+        return 'PE' if router in self.pe_set else 'P'
+
+    def platform(self, router):
+        """
+        Name of the template set the config of a router is rendered with
+        """
+        return self.platforms[self.role(router)]
+
+
+def compile_intent(intent):
+    """
+    Build the indexed intent model from a raw intent dict
+    """
+    return CompiledIntent(intent)
@@ -0,0 +1,45 @@
+import importlib
+import sys
+
+# subcommand -> (module, help); a module is only imported when its subcommand runs,
+# so 'nas.py generate' never loads networkx or matplotlib
+COMMANDS = {
+    "generate": ("create_config", "generate the router configs from intent.json"),
+    "validate": ("validate", "check an intent file without generating anything"),
+    "summarize": ("addresses", "summarise the interfaces and addresses of the configs"),
+    "graph": ("create_graph", "draw or export the router topology"),
+    "analyze": ("topology_analytics", "analyse the SP core topology"),
+    "simulate": ("simulate", "check OSPF, LDP, BGP/VPNv4 and CE reachability from the configs"),
+    "diff": ("config_diff", "compare deployed or previous configs with new ones"),
+    "delta": ("config_delta", "write the CLI commands that turn running configs into new ones"),
+    "deploy": ("drag_drop_bot", "deploy the configs to the GNS3 project"),
+}
+
+
+def usage():
+    lines = ["usage: nas.py <command> [options]", "", "commands:"]
+    lines += [f"  {name:<10} {help}" for name, (_, help) in COMMANDS.items()]
+    lines.append("")
+    lines.append("'nas.py <command> --help' shows the options of a command.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """
+    Run a subcommand with the rest of the command line
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(usage(), file=sys.stderr)
+        print(f"\nnas.py: unknown command '{command}'", file=sys.stderr)
+        return 2
+    module = importlib.import_module(COMMANDS[command][0])
+    return module.main(rest) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,522 @@
+import argparse
+import ipaddress
+import json
+import sys
+from collections import defaultdict, deque
+
+from addresses import AddressIndex, load_configs
+
+
+def _subnet(ip, mask):
+    """
+    (network address as int, prefix length) of an interface address
+    """
+    network = ipaddress.IPv4Network(f"{ip}/{mask}", strict=False)
+    return int(network.network_address), network.prefixlen
+
+
+def _contains(subnet, ip):
+    network, prefixlen = subnet
+    shift = 32 - prefixlen
+    return int(ipaddress.IPv4Address(ip)) >> shift == network >> shift
+
+
+def _prefix(subnet):
+    return f"{ipaddress.IPv4Address(subnet[0])}/{subnet[1]}"
+
+
+class ControlPlane:
+    """
+    Offline model of the control plane described by a set of parsed configs.
+
+    Everything is computed with graph traversals over dicts, in this order:
+    OSPF adjacencies (interfaces of the same area sharing a subnet), OSPF
+    reachability (connected components of the adjacency graph), LDP sessions
+    (adjacencies whose two interfaces run 'mpls ip'), BGP sessions (both ends
+    configured for each other and reachable), VPNv4 propagation over the iBGP
+    sessions (with route reflection) and finally the VRF tables and the routes
+    each CE learns.
+    """
+    def __init__(self, configs):
+        self.configs = configs
+        self.index = AddressIndex(configs)
+        self.problems = []
+        # connected subnets of every router: router -> [(subnet, interface name)]
+        self.connected = {
+            router: [
+                (_subnet(intf.ip, intf.mask), name)
+                for name, intf in config.interfaces.items() if intf.ip and not intf.shutdown
+            ]
+            for router, config in configs.items()
+        }
+        self._build_ospf()
+        self._build_ldp()
+        self._build_bgp()
+        self._labeled = {} # egress router -> routers with a labeled path to it
+
+    # OSPF
+
+    def _ospf_interfaces(self, config):
+        """
+        Interface name -> area of the up, global interfaces covered by a 'network' statement
+        """
+        networks = [network for ospf in config.ospf.values() for network in ospf.networks]
+        enabled = {}
+        for name, intf in config.interfaces.items():
+            if intf.ip and not intf.shutdown and intf.vrf is None:
+                for network in networks:
+                    if network.covers(intf.ip):
+                        enabled[name] = network.area
+                        break
+        return enabled
+
+    def _build_ospf(self):
+        self.ospf_enabled = {router: self._ospf_interfaces(config) for router, config in self.configs.items()}
+        segments = defaultdict(list) # subnet -> [(router, interface, area)]
+        for router, interfaces in self.ospf_enabled.items():
+            for name, area in interfaces.items():
+                intf = self.configs[router].interfaces[name]
+                subnet = _subnet(intf.ip, intf.mask)
+                if subnet[1] < 32:
+                    segments[subnet].append((router, name, area))
+        self.adjacency = defaultdict(dict) # router -> {neighbour: [(local interface, peer interface)]}
+        for subnet, members in segments.items():
+            for i, (a, intf_a, area_a) in enumerate(members):
+                for b, intf_b, area_b in members[i + 1:]:
+                    if a == b:
+                        continue
+                    if area_a != area_b:
+                        self.problems.append(f"OSPF: {a}:{intf_a} (area {area_a}) and {b}:{intf_b} "
+                                             f"(area {area_b}) share {_prefix(subnet)} in different areas")
+                        continue
+                    self.adjacency[a].setdefault(b, []).append((intf_a, intf_b))
+                    self.adjacency[b].setdefault(a, []).append((intf_b, intf_a))
+        # OSPF domains: connected components of the adjacency graph
+        self.component = {}
+        for router in self.ospf_enabled:
+            if router in self.component or not self.ospf_enabled[router]:
+                continue
+            self.component[router] = router
+            queue = deque([router])
+            while queue:
+                current = queue.popleft()
+                for neighbour in self.adjacency.get(current, ()):
+                    if neighbour not in self.component:
+                        self.component[neighbour] = router
+                        queue.append(neighbour)
+
+    def spf(self, root):
+        """
+        OSPF shortest-path distances from a router (every generated interface has the same cost)
+
+        Returns:
+            dict: router -> cost
+        """
+        dist = {root: 0}
+        queue = deque([root])
+        while queue:
+            router = queue.popleft()
+            for neighbour in self.adjacency.get(router, ()):
+                if neighbour not in dist:
+                    dist[neighbour] = dist[router] + 1
+                    queue.append(neighbour)
+        return dist
+
+    def ospf_reachable(self, router, ip):
+        """
+        True if `router` has an OSPF route to `ip` (an address advertised by another router of its domain)
+        """
+        owner = self.index.lookup(ip)
+        if owner is None or router not in self.component:
+            return False
+        owner_router, owner_intf = owner
+        return (self.component.get(owner_router) == self.component[router]
+                and owner_intf in self.ospf_enabled[owner_router])
+
+    # LDP
+
+    def _build_ldp(self):
+        self.ldp = defaultdict(set) # router -> routers it has an LDP session with
+        for a, neighbours in self.adjacency.items():
+            for b, pairs in neighbours.items():
+                if any(self.configs[a].interfaces[intf_a].mpls and self.configs[b].interfaces[intf_b].mpls
+                       for intf_a, intf_b in pairs):
+                    self.ldp[a].add(b)
+
+    def labeled_routers(self, egress):
+        """
+        Routers that reach `egress` over a label-switched path.
+
+        A router has a path when one of its OSPF next hops towards the egress has
+        an LDP session with it and a path itself; routers are visited by
+        increasing distance, so this is one BFS per egress.
+        """
+        if egress in self._labeled:
+            return self._labeled[egress]
+        dist = self.spf(egress)
+        labeled = {egress}
+        for router in sorted(dist, key=dist.get):
+            if router == egress:
+                continue
+            if any(dist.get(hop) == dist[router] - 1 and hop in labeled and hop in self.ldp.get(router, ())
+                   for hop in self.adjacency.get(router, ())):
+                labeled.add(router)
+        self._labeled[egress] = labeled
+        return labeled
+
+    # BGP
+
+    def _source_ip(self, router, neighbor):
+        """
+        Address a router uses for a BGP session: its update-source interface, else
+        the interface connected to the neighbor
+        """
+        config = self.configs[router]
+        if neighbor.update_source:
+            intf = config.interfaces.get(neighbor.update_source)
+            return intf.ip if intf is not None else None
+        for subnet, name in self.connected[router]:
+            if _contains(subnet, neighbor.ip):
+                return config.interfaces[name].ip
+        return None
+
+    def _bgp_neighbors(self, router):
+        """
+        (VRF or None, BgpNeighbor) of every neighbor with a remote-as
+        """
+        bgp = self.configs[router].bgp
+        neighbors = [(None, neighbor) for neighbor in bgp.neighbors.values() if neighbor.remote_as]
+        for family in bgp.address_families.values():
+            if family.vrf:
+                neighbors += [(family.vrf, n) for n in family.neighbors.values() if n.remote_as]
+        return neighbors
+
+    def _build_bgp(self):
+        """
+        Find the established BGP sessions (router -> {peer: session}) and report the broken ones
+        """
+        configured = {} # (router, source ip, neighbor ip) -> (vrf, neighbor)
+        for router, config in self.configs.items():
+            if config.bgp is None:
+                continue
+            for vrf, neighbor in self._bgp_neighbors(router):
+                configured[(router, self._source_ip(router, neighbor), neighbor.ip)] = (vrf, neighbor)
+
+        self.sessions = defaultdict(dict)
+        for (router, source, peer_ip), (vrf, neighbor) in configured.items():
+            owner = self.index.lookup(peer_ip)
+            label = f"BGP: {router} -> {peer_ip}"
+            if owner is None:
+                self.problems.append(f"{label}: no router owns this address")
+                continue
+            peer = owner[0]
+            if router in self.sessions.get(peer, {}):
+                continue # already checked from the other end
+            peer_bgp = self.configs[peer].bgp
+            if source is None:
+                self.problems.append(f"{label}: no source address")
+                continue
+            reverse = configured.get((peer, peer_ip, source))
+            if peer_bgp is None or reverse is None:
+                self.problems.append(f"{label}: {peer} has no matching 'neighbor {source}' statement")
+                continue
+            peer_vrf, peer_neighbor = reverse
+            if neighbor.remote_as != peer_bgp.asn or peer_neighbor.remote_as != self.configs[router].bgp.asn:
+                self.problems.append(f"{label}: remote-as mismatch with {peer}")
+                continue
+            ibgp = neighbor.remote_as == self.configs[router].bgp.asn
+            connected = any(_contains(subnet, peer_ip) for subnet, _ in self.connected[router])
+            if not connected:
+                if not ibgp or vrf or peer_vrf:
+                    self.problems.append(f"{label}: eBGP peer {peer} is not directly connected")
+                    continue
+                if not (self.ospf_reachable(router, peer_ip) and self.ospf_reachable(peer, source)):
+                    self.problems.append(f"{label}: {peer} is not reachable through OSPF")
+                    continue
+            elif (self.configs[router].interfaces[self.index.lookup(source)[1]].vrf != vrf
+                  or self.configs[peer].interfaces[owner[1]].vrf != peer_vrf):
+                self.problems.append(f"{label}: session and interface VRFs do not match")
+                continue
+            self.sessions[router][peer] = {'vrf': vrf, 'ibgp': ibgp, 'neighbor': neighbor, 'source': source}
+            self.sessions[peer][router] = {'vrf': peer_vrf, 'ibgp': ibgp, 'neighbor': peer_neighbor,
+                                           'source': peer_ip}
+
+        # VPNv4 sessions: iBGP sessions activated for vpnv4 on both ends
+        self.vpn_peers = defaultdict(dict) # router -> {peer: {'client': bool, 'extended': bool}}
+        for router, peers in self.sessions.items():
+            vpnv4 = self.configs[router].bgp.address_families.get('vpnv4')
+            for peer, session in peers.items():
+                if not session['ibgp'] or vpnv4 is None:
+                    continue
+                neighbor = vpnv4.neighbors.get(session['neighbor'].ip)
+                peer_vpnv4 = self.configs[peer].bgp.address_families.get('vpnv4')
+                peer_neighbor = peer_vpnv4 and peer_vpnv4.neighbors.get(self.sessions[peer][router]['neighbor'].ip)
+                if neighbor and neighbor.activate and peer_neighbor and peer_neighbor.activate:
+                    self.vpn_peers[router][peer] = {
+                        'client': neighbor.route_reflector_client,
+                        'extended': neighbor.send_community in ('extended', 'both'),
+                    }
+        self.reflector = {router: any(info['client'] for info in peers.values())
+                          for router, peers in self.vpn_peers.items()}
+        # cluster-id of every BGP router (its router name stands for the router-id)
+        self.cluster = {router: config.bgp.cluster_id or router
+                        for router, config in self.configs.items() if config.bgp}
+        self._importers = {} # origin PE -> PEs that can install its VPNv4 routes
+
+    def vpnv4_receivers(self, origin):
+        """
+        PEs that receive the VPNv4 routes of `origin`, following the iBGP rules:
+        routes learned from a non-client are only reflected to clients, routes
+        learned from a client go to every peer, and a reflector drops routes whose
+        cluster list already holds its cluster-id. Routes sent without extended
+        communities carry no route target and are not followed.
+        """
+        received = set()
+        start = (origin, None, frozenset())
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            router, from_client, clusters = queue.popleft()
+            if from_client is not None:
+                if not self.reflector.get(router):
+                    continue
+                clusters = clusters | {self.cluster[router]}
+            for peer, info in self.vpn_peers.get(router, {}).items():
+                if from_client is False and not info['client']:
+                    continue
+                if peer == origin or not info['extended'] or self.cluster[peer] in clusters:
+                    continue
+                received.add(peer)
+                state = (peer, self.vpn_peers[peer][router]['client'], clusters)
+                if state not in seen:
+                    seen.add(state)
+                    queue.append(state)
+        return received
+
+    def importing_pes(self, origin):
+        """
+        PEs that receive the VPNv4 routes of `origin` and can forward to it: its
+        next hop is reachable through OSPF and over a label-switched path
+        """
+        if origin not in self._importers:
+            next_hop = next((s['source'] for s in self.sessions.get(origin, {}).values() if s['ibgp']), None)
+            labeled = self.labeled_routers(origin)
+            # the next hop is reachable from the routers of its OSPF domain if it is advertised
+            domain = self.component.get(origin) if next_hop and self.ospf_reachable(origin, next_hop) else None
+            self._importers[origin] = {origin} | {
+                pe for pe in self.vpnv4_receivers(origin)
+                if domain is not None and pe in labeled and self.component.get(pe) == domain
+            }
+        return self._importers[origin]
+
+    # VRFs
+
+    def vrf_tables(self):
+        """
+        Routes of every VRF: PE -> VRF -> {prefix: [(origin router, AS path, egress PE)]}
+
+        A VRF holds the routes of its CEs, its redistributed connected subnets
+        and the VPNv4 routes of other VRFs whose export RTs it imports, when the
+        egress PE is reachable through OSPF and over a label-switched path.
+        """
+        tables = defaultdict(dict)
+        local = {} # (pe, vrf) -> {prefix: [route]}
+        for router, config in self.configs.items():
+            if config.bgp is None:
+                continue
+            for family in config.bgp.address_families.values():
+                vrf = family.vrf
+                if vrf is None or vrf not in config.vrfs or not config.vrfs[vrf].rd:
+                    continue
+                routes = defaultdict(list)
+                if 'connected' in family.redistribute:
+                    for subnet, name in self.connected[router]:
+                        if config.interfaces[name].vrf == vrf:
+                            routes[_prefix(subnet)].append((router, (), router))
+                for peer, session in self.sessions.get(router, {}).items():
+                    if session['vrf'] == vrf and not session['ibgp']:
+                        for prefix in self.advertised(peer):
+                            routes[prefix].append((peer, (self.configs[peer].bgp.asn,), router))
+                local[(router, vrf)] = routes
+                tables[router][vrf] = {prefix: list(paths) for prefix, paths in routes.items()}
+
+        # route target -> VRFs importing it, so each export only meets its importers
+        importers = defaultdict(list)
+        for pe, vrf in local:
+            for rt in dict.fromkeys(self.configs[pe].vrfs[vrf].rt_import):
+                importers[rt].append((pe, vrf))
+        for (origin, vrf), routes in local.items():
+            receivers = self.importing_pes(origin)
+            targets = {
+                (pe, other_vrf)
+                for rt in self.configs[origin].vrfs[vrf].rt_export
+                for pe, other_vrf in importers.get(rt, ())
+                if pe in receivers and (pe, other_vrf) != (origin, vrf)
+            }
+            for pe, other_vrf in targets:
+                table = tables[pe][other_vrf]
+                for prefix, paths in routes.items():
+                    table.setdefault(prefix, []).extend(paths)
+        return tables
+
+    def advertised(self, router):
+        """
+        Prefixes a router announces with 'network' statements that match one of its interfaces
+        """
+        bgp = self.configs[router].bgp
+        own = {_prefix(subnet) for subnet, _ in self.connected[router]}
+        prefixes = []
+        for family in bgp.address_families.values():
+            if family.vrf is None and family.afi == 'ipv4':
+                for address, mask in family.networks:
+                    prefix = _prefix(_subnet(address, mask or '255.255.255.255'))
+                    if prefix in own:
+                        prefixes.append(prefix)
+        return prefixes
+
+    def ce_routes(self, tables):
+        """
+        Prefixes every CE learns from its PE.
+
+        Routes the CE originated itself are not sent back, and a CE rejects routes
+        whose AS path holds its own AS unless the PE uses as-override or the CE allowas-in.
+        """
+        learned = {}
+        for ce, peers in self.sessions.items():
+            for pe, session in peers.items():
+                pe_session = self.sessions[pe][ce]
+                if session['ibgp'] or session['vrf'] is not None or pe_session['vrf'] is None:
+                    continue
+                asn = self.configs[ce].bgp.asn
+                loop_ok = pe_session['neighbor'].as_override or session['neighbor'].allowas_in
+                routes = learned.setdefault(ce, set())
+                for prefix, paths in tables.get(pe, {}).get(pe_session['vrf'], {}).items():
+                    if any(origin != ce and (loop_ok or asn not in path) for origin, path, _ in paths):
+                        routes.add(prefix)
+        return learned
+
+    def ce_attachments(self):
+        """
+        CE -> (PE, VRF) of every established PE-CE session
+        """
+        return {
+            ce: (pe, self.sessions[pe][ce]['vrf'])
+            for ce, peers in self.sessions.items() for pe, session in peers.items()
+            if not session['ibgp'] and session['vrf'] is None and self.sessions[pe][ce]['vrf'] is not None
+        }
+
+    def expected_pairs(self):
+        """
+        CE pairs the route targets are meant to connect: both CEs sit in the same
+        VRF of a PE, or each VRF imports a route target the other exports
+
+        Returns:
+            dict: CE -> set of CEs
+        """
+        attached = self.ce_attachments()
+        vrfs = {ce: self.configs[pe].vrfs.get(vrf) for ce, (pe, vrf) in attached.items()}
+        exporters = defaultdict(set)
+        same_vrf = defaultdict(set)
+        for ce, vrf in vrfs.items():
+            same_vrf[attached[ce]].add(ce)
+            for rt in vrf.rt_export if vrf else ():
+                exporters[rt].add(ce)
+        expected = {}
+        for a, vrf in vrfs.items():
+            peers = set(same_vrf[attached[a]])
+            exports = set(vrf.rt_export) if vrf else set()
+            for rt in vrf.rt_import if vrf else ():
+                peers |= {b for b in exporters.get(rt, ()) if vrfs[b] and exports & set(vrfs[b].rt_import)}
+            peers.discard(a)
+            expected[a] = peers
+        return expected
+
+    def ce_reachability(self):
+        """
+        Which CE loopbacks reach which others: A reaches B when A has a route to
+        B's loopback and B has a route back to A's
+
+        Returns:
+            dict: CE -> sorted list of CEs whose loopback it reaches
+        """
+        learned = self.ce_routes(self.vrf_tables())
+        loopbacks = {}
+        for ce in learned:
+            for subnet, name in self.connected[ce]:
+                if name.startswith('Loopback'):
+                    loopbacks[ce] = _prefix(subnet)
+                    break
+        owner = {prefix: ce for ce, prefix in loopbacks.items()}
+        return {
+            a: sorted(
+                owner[prefix] for prefix in learned[a]
+                if prefix in owner and owner[prefix] != a and loopbacks[a] in learned[owner[prefix]]
+            )
+            for a in sorted(loopbacks)
+        }
+
+
+def simulate(configs):
+    """
+    Run the control-plane model on parsed configs and build a JSON-serialisable report
+    """
+    plane = ControlPlane(configs)
+    pes = sorted(router for router, peers in plane.vpn_peers.items() if peers)
+    missing_lsp = []
+    for b in pes:
+        labeled = plane.labeled_routers(b)
+        missing_lsp += [[a, b] for a in pes if a != b and a not in labeled]
+    reachability = plane.ce_reachability()
+    expected = plane.expected_pairs()
+    unreachable = [
+        [a, b] for a in sorted(expected) for b in sorted(expected[a])
+        if b not in set(reachability.get(a, ()))
+    ]
+    return {
+        'routers': len(configs),
+        'ospf': {
+            'adjacencies': sum(len(n) for n in plane.adjacency.values()) // 2,
+            'domains': len(set(plane.component.values())),
+        },
+        'ldp_sessions': sum(len(n) for n in plane.ldp.values()) // 2,
+        'pe_pairs_without_lsp': missing_lsp,
+        'bgp_sessions': sum(len(n) for n in plane.sessions.values()) // 2,
+        'vpnv4_sessions': sum(len(n) for n in plane.vpn_peers.values()) // 2,
+        'problems': plane.problems,
+        'ce_reachability': reachability,
+        'ce_pairs_reachable': sum(len(reached) for reached in reachability.values()),
+        'ce_pairs_expected': sum(len(peers) for peers in expected.values()),
+        'ce_pairs_unreachable': unreachable,
+    }
+
+
+def main(argv=None):
+    """
+    Check the rendered configs without booting the lab
+    """
+    parser = argparse.ArgumentParser(description="Simulate OSPF, LDP, BGP and VRFs from the rendered configs")
+    parser.add_argument("--configs", default="configs", help="directory holding the router configs")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="worker processes used to parse the configs")
+    parser.add_argument("--output", default="simulation_report.json", help="report file to write")
+    args = parser.parse_args(argv)
+
+    report = simulate(load_configs(args.configs, jobs=args.jobs))
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"{report['routers']} routers: {report['ospf']['adjacencies']} OSPF adjacencies in "
+          f"{report['ospf']['domains']} domain(s), {report['ldp_sessions']} LDP sessions, "
+          f"{report['bgp_sessions']} BGP sessions ({report['vpnv4_sessions']} VPNv4)")
+    for problem in report['problems']:
+        print(f"Problem: {problem}")
+    if report['pe_pairs_without_lsp']:
+        print(f"{len(report['pe_pairs_without_lsp'])} PE pair(s) without a label-switched path")
+    print(f"CE loopback pairs reachable: {report['ce_pairs_reachable']} "
+          f"({report['ce_pairs_expected']} expected from the route targets)")
+    for a, b in report['ce_pairs_unreachable']:
+        print(f"Unreachable: {a} -> {b} loopback")
+    print(f"Report written to {args.output}")
+    return 1 if report['problems'] or report['pe_pairs_without_lsp'] or report['ce_pairs_unreachable'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
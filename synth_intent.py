@@ -0,0 +1,198 @@
+import argparse
+import ipaddress
+import json
+import random
+
+SP_ASN = 65000
+
+
+def _carve(cursor, count):
+    """
+    Carve the smallest aligned prefix holding `count` addresses out of 10.0.0.0/8
+
+    Returns:
+        tuple: (IPv4Network, next cursor)
+    """
+    size = 4
+    while size < count:
+        size *= 2
+    start = (cursor + size - 1) // size * size
+    network = ipaddress.IPv4Network((int(ipaddress.IPv4Address('10.0.0.0')) + start, 32 - size.bit_length() + 1))
+    if start + size > 1 << 24:
+        raise ValueError("the synthetic intent does not fit in 10.0.0.0/8")
+    return network, start + size
+
+
+def _interface(index):
+    return f"GigabitEthernet{index // 16 + 1}/{index % 16}"
+
+
+def generate_intent(pe=2, p=2, ce=6, link_density=3.0, customers=None, vrfs_per_customer=1,
+                    route_reflectors=0, seed=0, ipv6=False):
+    """
+    Build a synthetic intent with the same layout as intent.json
+
+    The P routers form a ring with random chords added until their average core
+    degree reaches `link_density`, and every PE is dual-homed to two P routers
+    (or the PEs form the ring when there is no P router). CEs are spread round-robin
+    over the PEs, customers and VRFs.
+
+    Args:
+        pe, p, ce (int): number of PE, P and CE routers
+        link_density (float): target average number of core links of a P router
+        customers (int, optional): number of customers, one per 4 CEs by default
+        vrfs_per_customer (int): VRFs of each customer; VRFs of a customer import each other
+        route_reflectors (int): with 0 the PEs are fully meshed, otherwise this many
+            reflectors are chosen automatically ('route_reflector' iBGP mode)
+        seed (int): seed of the random chords, the same arguments give the same intent
+        ipv6 (bool): also give the SP core IPv6 prefixes (/127 links, /128 loopbacks)
+
+    Returns:
+        dict: raw intent
+    """
+    rng = random.Random(seed)
+    pe_routers = [f"R{i}" for i in range(1, pe + 1)]
+    p_routers = [f"R{i}" for i in range(pe + 1, pe + p + 1)]
+    ce_routers = [f"R{i}" for i in range(pe + p + 1, pe + p + ce + 1)]
+    customers = customers or max(1, ce // 4)
+
+    # core links as unordered pairs, in creation order
+    pairs = {}
+    def connect(a, b):
+        if a != b and (a, b) not in pairs and (b, a) not in pairs:
+            pairs[(a, b)] = None
+    ring = p_routers or pe_routers
+    for i, router in enumerate(ring):
+        if len(ring) > 1:
+            connect(router, ring[(i + 1) % len(ring)])
+    target = int(len(ring) * link_density / 2)
+    attempts = 0
+    while len(pairs) < target and attempts < 4 * target:
+        connect(rng.choice(ring), rng.choice(ring))
+        attempts += 1
+    if p_routers:
+        for i, router in enumerate(pe_routers):
+            connect(router, p_routers[i % len(p_routers)])
+            connect(router, p_routers[(i + len(p_routers) // 2) % len(p_routers)])
+
+    used = {}  # router -> interfaces used so far
+    def next_interface(router):
+        used[router] = used.get(router, 0) + 1
+        return _interface(used[router] - 1)
+    links = []
+    for a, b in pairs:
+        intf_a, intf_b = next_interface(a), next_interface(b)
+        links.append({"from": f"{a}:{intf_a}", "to": f"{b}:{intf_b}"})
+        links.append({"from": f"{b}:{intf_b}", "to": f"{a}:{intf_a}"})
+
+    # customers and their VRFs
+    cursor = 0
+    customer_list = []
+    vrf_names = []
+    ces_per_customer = [len(range(i, ce, customers)) for i in range(customers)]
+    rd = 0
+    for i in range(customers):
+        name = f"Customer{i + 1}"
+        vrfs = [name] if vrfs_per_customer == 1 else [f"{name}_{j + 1}" for j in range(vrfs_per_customer)]
+        first_rd = rd + 1
+        vrf_info = {}
+        for j, vrf in enumerate(vrfs):
+            rd += 1
+            info = {"rd": f"1:{rd}", "rt": f"1:{rd}"}
+            others = [f"1:{first_rd + k}" for k in range(len(vrfs)) if k != j]
+            if others:
+                info["import_rts"] = others
+            vrf_info[vrf] = info
+        base, cursor = _carve(cursor, 4 * max(1, ces_per_customer[i]))
+        loopback, cursor = _carve(cursor, max(1, ces_per_customer[i]) + 2)
+        customer_list.append({
+            "name": name,
+            "asn": 65001 + i if i < 500 else 4200000000 + i,
+            "base_prefix": str(base),
+            "loopback_prefix": str(loopback),
+            "vrfs": vrf_info,
+        })
+        vrf_names.append(vrfs)
+
+    # CE attachments
+    ebgp_peers = []
+    for i, router in enumerate(ce_routers):
+        pe_router = pe_routers[i % len(pe_routers)]
+        customer = i % customers
+        vrfs = vrf_names[customer]
+        vrf = vrfs[(i // customers) % len(vrfs)]
+        intf = next_interface(pe_router)
+        links.append({"from": f"{pe_router}:{intf}", "to": f"CE:{router}:GigabitEthernet1/0"})
+        ebgp_peers.append({"pe": pe_router, "ce": router, "vrf": vrf, "interface": intf})
+
+    sp_base, cursor = _carve(cursor, 4 * max(1, len(pairs)))
+    sp_loopback, cursor = _carve(cursor, pe + p + 2)
+    service_provider = {
+        "asn": SP_ASN,
+        "base_prefix": str(sp_base),
+        "loopback_prefix": str(sp_loopback),
+        "routers": {"PE": pe_routers, "P": p_routers},
+        "links": links,
+    }
+    if ipv6:
+        service_provider["base_prefix_v6"] = "2001:db8:0:1::/64"
+        service_provider["loopback_prefix_v6"] = "2001:db8:0:2::/64"
+    if route_reflectors:
+        service_provider["ibgp"] = {"mode": "route_reflector", "reflector_count": route_reflectors}
+    return {
+        "network": {"service_provider": service_provider, "customers": customer_list},
+        "protocols": {
+            "ospf": {"area": "0"},
+            "ldp": {"enabled": True},
+            "bgp": {"ebgp_peers": ebgp_peers},
+        },
+    }
+
+
+def scaled_intent(routers, **kwargs):
+    """
+    Synthetic intent of about `routers` routers: 20% PE, 10% P and 70% CE
+    (at least 2 PEs and 1 P), with a route reflector per 50 PEs above 20 PEs
+    """
+    pe = max(2, routers // 5)
+    p = max(1, routers // 10)
+    ce = max(1, routers - pe - p)
+    kwargs.setdefault('route_reflectors', 0 if pe <= 20 else max(2, pe // 50))
+    return generate_intent(pe=pe, p=p, ce=ce, **kwargs)
+
+
+def main(argv=None):
+    """
+    Write a synthetic intent file
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic intent")
+    parser.add_argument("--routers", type=int, help="total router count (overrides --pe/--p/--ce)")
+    parser.add_argument("--pe", type=int, default=2, help="number of PE routers")
+    parser.add_argument("--p", type=int, default=2, help="number of P routers")
+    parser.add_argument("--ce", type=int, default=6, help="number of CE routers")
+    parser.add_argument("--link-density", type=float, default=3.0, help="average core degree of the P routers")
+    parser.add_argument("--customers", type=int, help="number of customers (default: one per 4 CEs)")
+    parser.add_argument("--vrfs-per-customer", type=int, default=1, help="VRFs of each customer")
+    parser.add_argument("--route-reflectors", type=int, help="route reflector count (0: full mesh)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--ipv6", action="store_true", help="add IPv6 prefixes for the SP core")
+    parser.add_argument("--output", default="synthetic_intent.json", help="intent file to write")
+    args = parser.parse_args(argv)
+
+    options = dict(link_density=args.link_density, customers=args.customers,
+                   vrfs_per_customer=args.vrfs_per_customer, seed=args.seed, ipv6=args.ipv6)
+    if args.route_reflectors is not None:
+        options['route_reflectors'] = args.route_reflectors
+    if args.routers:
+        intent = scaled_intent(args.routers, **options)
+    else:
+        intent = generate_intent(pe=args.pe, p=args.p, ce=args.ce, **options)
+    with open(args.output, 'w') as f:
+        json.dump(intent, f, indent=2)
+    sp = intent['network']['service_provider']
+    print(f"Wrote {args.output}: {len(sp['routers']['PE'])} PE, {len(sp['routers']['P'])} P, "
+          f"{len(intent['protocols']['bgp']['ebgp_peers'])} CE, {len(sp['links'])} link entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import ipaddress
+import os
+import re
+import string
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+SECTIONS = ('base', 'vrf', 'loopback', 'interfaces', 'ospf', 'bgp', 'ce_bgp')
+
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+_FORMAT_SPEC = re.compile(r"[\w<>=^+\- .,#%]*")
+# compiled template sets of this process, by platform
+_template_sets = {}
+# dotted netmask and wildcard of every IPv4 prefix length
+_NETMASKS = [str(ipaddress.IPv4Address((0xFFFFFFFF << (32 - n)) & 0xFFFFFFFF)) for n in range(33)]
+_WILDCARDS = [str(ipaddress.IPv4Address(0xFFFFFFFF >> n)) for n in range(33)]
+
+
+class TemplateError(Exception):
+    """
+    Raised when a template set is missing or a template cannot be compiled
+    """
+
+
+class Address:
+    """
+    An address and its prefix length, as a template field.
+
+    The format spec of the placeholder picks the notation, so each platform
+    writes masks, wildcards or prefix lengths its own way:
+    {addr} or {addr:ip} -> 192.0.2.1, {addr:prefixlen} -> 30,
+    {addr:cidr} -> 192.0.2.1/30, {addr:mask} -> 255.255.255.252,
+    {addr:wildcard} -> 0.0.0.3, {addr:network} -> 192.0.2.0 and
+    {addr:prefix} -> 192.0.2.0/30 (mask and wildcard are IPv4 only).
+    """
+    __slots__ = ('ip', 'prefixlen')
+
+    def __init__(self, ip, prefixlen):
+        self.ip = ip
+        self.prefixlen = prefixlen
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Address from 'ip/prefixlen' (the form the allocator stores loopbacks in)
+        """
+        ip, prefixlen = text.split('/')
+        return cls(ip, int(prefixlen))
+
+    def __str__(self):
+        return str(self.ip)
+
+    def __format__(self, spec):
+        if spec in ('', 'ip'):
+            return str(self.ip)
+        if spec == 'prefixlen':
+            return str(self.prefixlen)
+        if spec == 'cidr':
+            return f"{self.ip}/{self.prefixlen}"
+        if spec == 'mask' or spec == 'wildcard':
+            ip = self.ip
+            if (':' in ip) if isinstance(ip, str) else ip.version == 6:
+                raise TemplateError(f"IPv6 address {ip} has no {spec} notation")
+            return (_NETMASKS if spec == 'mask' else _WILDCARDS)[self.prefixlen]
+        if spec == 'network' or spec == 'prefix':
+            ip = ipaddress.ip_address(self.ip) if isinstance(self.ip, str) else self.ip
+            host_bits = ip.max_prefixlen - self.prefixlen
+            network = type(ip)(int(ip) >> host_bits << host_bits)
+            return str(network) if spec == 'network' else f"{network}/{self.prefixlen}"
+        raise TemplateError(f"unknown address format {spec!r} "
+                            f"(expected ip, prefixlen, cidr, mask, wildcard, network or prefix)")
+
+
+def parse_fragments(text, path="<template>"):
+    """
+    Split a section template into its named fragments.
+
+    A fragment starts at a '## name' line and runs until the next one; lines
+    before the first fragment are a free description and trailing blank lines
+    of a fragment are dropped.
+
+    Returns:
+        dict: fragment name -> template text (lines joined by newlines)
+    """
+    fragments = {}
+    name = None
+    for line in text.splitlines():
+        if line.startswith("## "):
+            name = line[3:].strip()
+            if not _IDENTIFIER.fullmatch(name) or name in fragments:
+                raise TemplateError(f"{path}: invalid or duplicate fragment name {name!r}")
+            fragments[name] = []
+        elif name is not None:
+            fragments[name].append(line.rstrip())
+    for name, lines in fragments.items():
+        while lines and not lines[-1]:
+            lines.pop()
+        fragments[name] = "\n".join(lines)
+    return fragments
+
+
+def compile_fragment(name, text, path="<template>"):
+    """
+    Compile a fragment into a function that renders it with keyword arguments.
+
+    '{field}' placeholders use the str.format syntax (with an optional
+    conversion and format spec). The fragment is turned into a single f-string,
+    so rendering it costs what a hand-written f-string costs; fields the caller
+    passes but the fragment does not use are ignored.
+    """
+    fields = []
+    source = []
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as e:
+        raise TemplateError(f"{path}: fragment {name}: {e}") from None
+    for literal, field, spec, conversion in parsed:
+        source.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if not _IDENTIFIER.fullmatch(field) or not _FORMAT_SPEC.fullmatch(spec or ""):
+            raise TemplateError(f"{path}: fragment {name}: unsupported placeholder {{{field}}}")
+        if field not in fields:
+            fields.append(field)
+        source.append("{" + field + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}")
+    params = f"*, {', '.join(fields)}, **_" if fields else "**_"
+    code = f"def {name}({params}):\n    return f{''.join(source)!r}\n"
+    namespace = {}
+    try:
+        exec(compile(code, f"{path}:{name}", "exec"), namespace)
+    except SyntaxError as e:
+        raise TemplateError(f"{path}: fragment {name} does not compile ({e.msg})") from None
+    return namespace[name]
+
+
+class Section:
+    """
+    Compiled fragments of one section template, as attributes
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            fragments = parse_fragments(f.read(), path)
+        self.path = path
+        self.names = list(fragments)
+        for name, text in fragments.items():
+            setattr(self, name, compile_fragment(name, text, path))
+
+    def __getattr__(self, name):
+        # only called for fragments the template does not define
+        raise TemplateError(f"{self.__dict__.get('path', '<template>')}: no fragment named {name!r}")
+
+
+class TemplateSet:
+    """
+    The section templates of a platform, read from templates/<platform>/<section>.cfg
+    """
+    def __init__(self, platform, template_dir=TEMPLATE_DIR):
+        self.platform = platform
+        self.directory = os.path.join(template_dir, platform)
+        if not os.path.isdir(self.directory):
+            raise TemplateError(f"no template set for platform {platform!r} in {template_dir}")
+        for section in SECTIONS:
+            path = os.path.join(self.directory, f"{section}.cfg")
+            if not os.path.exists(path):
+                raise TemplateError(f"template set {platform!r} has no {section}.cfg")
+            setattr(self, section, Section(path))
+
+    @property
+    def files(self):
+        return [os.path.join(self.directory, f"{section}.cfg") for section in SECTIONS]
+
+
+def load_template_set(platform):
+    """
+    Return the compiled template set of a platform, compiling it on first use only
+    """
+    templates = _template_sets.get(platform)
+    if templates is None:
+        templates = _template_sets[platform] = TemplateSet(platform)
+    return templates
+
+
+def available_platforms(template_dir=TEMPLATE_DIR):
+    if not os.path.isdir(template_dir):
+        return []
+    return sorted(name for name in os.listdir(template_dir) if os.path.isdir(os.path.join(template_dir, name)))
+
+
+def template_files(platforms):
+    """
+    Template files of the given platforms and the engine that compiles them,
+    for the incremental fingerprint
+    """
+    paths = [os.path.abspath(__file__)]
+    paths += [path for platform in sorted(set(platforms)) for path in load_template_set(platform).files]
+    return paths
@@ -0,0 +1,303 @@
+import argparse
+import json
+import os
+
+from create_graph import build_topology_graph, topology_hash
+from fileutils import atomic_write
+
+# graphs with at least this many nodes use scipy.sparse.csgraph for shortest paths
+SPARSE_MIN_NODES = 500
+# default directory of the cached reports
+ANALYTICS_CACHE_DIR = '.analytics_cache'
+
+
+def _csgraph():
+    """
+    (numpy, csr_matrix, shortest_path), imported on first use, or None when
+    scipy is not installed (networkx BFS is used instead)
+    """
+    try:
+        import numpy as np
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import shortest_path
+    except ImportError:
+        return None
+    return np, csr_matrix, shortest_path
+
+
+def core_graph(G, sp_routers):
+    """
+    Subgraph of the SP routers, i.e. the routers that run OSPF and LDP
+    """
+    return G.subgraph([router for router in sp_routers if router in G]).copy()
+
+
+def spf_tree(G, root, weight='cost'):
+    """
+    OSPF shortest-path tree rooted at a router
+
+    Edges use their 'cost' attribute when present and a cost of 1 otherwise
+    (every generated interface has the same OSPF cost).
+
+    Returns:
+        dict: router -> parent router on the shortest path from root (root maps to None)
+    """
+    import networkx as nx
+
+    preds, _ = nx.dijkstra_predecessor_and_distance(G, root, weight=lambda u, v, d: d.get(weight, 1))
+    return {node: (min(parents) if parents else None) for node, parents in preds.items()}
+
+
+def _indexed_adjacency(G):
+    """
+    The graph as plain lists, built once: (node names, node -> index, neighbour
+    indexes of each node). Walking lists of ints is much cheaper than walking
+    the networkx adjacency views.
+    """
+    nodes = list(G.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    adjacency = [[index[v] for v in G[u]] for u in nodes]
+    return nodes, index, adjacency
+
+
+def _bfs_dag(adjacency, source):
+    """
+    BFS from a source over an indexed adjacency
+
+    Returns:
+        tuple: (visit order, hop distance list with -1 for unreached nodes,
+                shortest-path successors of each node)
+    """
+    dist = [-1] * len(adjacency)
+    dist[source] = 0
+    successors = [None] * len(adjacency)
+    order = [source]
+    for u in order: # order grows while it is walked, like a queue
+        next_hop = dist[u] + 1
+        children = []
+        for v in adjacency[u]:
+            if dist[v] < 0:
+                dist[v] = next_hop
+                order.append(v)
+                children.append(v)
+            elif dist[v] == next_hop:
+                children.append(v)
+        successors[u] = children
+    return order, dist, successors
+
+
+def spf_trees(G, roots, weight='cost'):
+    """
+    OSPF shortest-path trees of several roots.
+
+    With uniform costs (no 'cost' attribute on any link, as in the generated
+    configs) each tree comes from one BFS over the indexed adjacency; among
+    equal-cost parents the smallest router name is kept, as in spf_tree().
+
+    Returns:
+        dict: root -> {router: parent router} (the root itself is left out)
+    """
+    roots = [root for root in roots if root in G]
+    if any(weight in data for _, _, data in G.edges(data=True)):
+        return {root: {node: parent for node, parent in spf_tree(G, root, weight).items() if parent is not None}
+                for root in roots}
+    nodes, index, adjacency = _indexed_adjacency(G)
+    trees = {}
+    for root in roots:
+        order, _, successors = _bfs_dag(adjacency, index[root])
+        parent = {}
+        for u in order:
+            for v in successors[u]:
+                if v not in parent or nodes[u] < nodes[parent[v]]:
+                    parent[v] = u
+        trees[root] = {nodes[v]: nodes[u] for v, u in sorted(parent.items(), key=lambda item: nodes[item[0]])}
+    return trees
+
+
+def _sparse_hops(G, sources, csgraph):
+    """
+    Hop counts from every source with scipy.sparse.csgraph (unweighted BFS in C)
+    """
+    np, csr_matrix, shortest_path = csgraph
+    nodes = list(G.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    rows, cols = [], []
+    for a, b in G.edges():
+        rows += [index[a], index[b]]
+        cols += [index[b], index[a]]
+    matrix = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(len(nodes), len(nodes)))
+    dist = shortest_path(matrix, unweighted=True, directed=False, indices=[index[s] for s in sources])
+    return index, dist
+
+
+def pe_hop_counts(G, pe_routers):
+    """
+    All-pairs hop counts between PE routers
+
+    Returns:
+        dict: pe -> {pe: hops}; unreachable pairs are left out
+    """
+    import networkx as nx
+
+    pes = [pe for pe in pe_routers if pe in G]
+    csgraph = _csgraph() if G.number_of_nodes() >= SPARSE_MIN_NODES else None
+    if csgraph is not None:
+        np = csgraph[0]
+        index, dist = _sparse_hops(G, pes, csgraph)
+        # PE columns only, unreachable (inf) entries masked once, then plain Python ints
+        dist = dist[:, [index[pe] for pe in pes]]
+        rows = np.where(np.isfinite(dist), dist, -1).astype(np.int64).tolist()
+        return {
+            pe: {other: hops for other, hops in zip(pes, row) if hops >= 0}
+            for pe, row in zip(pes, rows)
+        }
+    targets = set(pes)
+    return {
+        pe: {other: hops for other, hops in nx.single_source_shortest_path_length(G, pe).items() if other in targets}
+        for pe in pes
+    }
+
+
+def single_points_of_failure(G):
+    """
+    Routers and links whose loss splits the graph
+
+    Returns:
+        dict: 'articulation_points' (sorted routers) and 'bridges' (sorted router pairs)
+    """
+    import networkx as nx
+
+    return {
+        'articulation_points': sorted(nx.articulation_points(G)),
+        'bridges': sorted(tuple(sorted(edge)) for edge in nx.bridges(G)),
+    }
+
+
+def ecmp_path_counts(G, pe_routers):
+    """
+    Count equal-cost (shortest) paths between PE routers.
+
+    One BFS per PE gives the number of shortest paths sigma(v) from the PE,
+    then a pass in reverse BFS order gives N(v), the number of shortest paths
+    from v down to any other PE. A link u-v on the shortest-path DAG carries
+    sigma(u) * N(v) of the paths leaving the PE, so the whole computation is
+    O(PEs * (routers + links)). The graph is converted once to lists of
+    integer indexes, so the BFS never goes through the networkx views.
+
+    Returns:
+        tuple: ({(pe_a, pe_b): ECMP path count} for each unordered pair,
+                {(router_a, router_b): PE-to-PE shortest paths crossing the link})
+    """
+    pes = [pe for pe in pe_routers if pe in G]
+    nodes, index, adjacency = _indexed_adjacency(G)
+    is_target = [False] * len(nodes)
+    for pe in pes:
+        is_target[index[pe]] = True
+    pair_paths = {}
+    link_paths = {} # (i, j) with i < j -> paths crossing the link
+    for source_name in pes:
+        source = index[source_name]
+        order, dist, successors = _bfs_dag(adjacency, source)
+        sigma = [0] * len(nodes)
+        sigma[source] = 1
+        for u in order:
+            for v in successors[u]:
+                sigma[v] += sigma[u]
+        below = [0] * len(nodes)
+        for u in reversed(order):
+            count = 1 if is_target[u] and u != source else 0
+            for v in successors[u]:
+                count += below[v]
+            below[u] = count
+        for target in pes:
+            t = index[target]
+            if t != source and dist[t] >= 0 and source_name < target:
+                pair_paths[(source_name, target)] = sigma[t]
+        for u in order:
+            crossing = sigma[u]
+            for v in successors[u]:
+                key = (u, v) if u < v else (v, u)
+                link_paths[key] = link_paths.get(key, 0) + crossing * below[v]
+    link_paths = {
+        tuple(sorted((nodes[i], nodes[j]))): link_paths.get((i, j) if i < j else (j, i), 0)
+        for i, j in ((index[a], index[b]) for a, b in G.edges())
+    }
+    # every unordered pair was walked from both ends
+    return pair_paths, {link: count // 2 for link, count in link_paths.items()}
+
+
+def analyze_topology(G, pe_routers, cache_dir=ANALYTICS_CACHE_DIR, spf_roots=None):
+    """
+    Compute the analytics report of a core graph, reusing a cached report when
+    the topology, PE set and SPF roots are unchanged
+
+    Args:
+        spf_roots (list, optional): routers whose SPF tree goes in the report (all PEs by default)
+
+    Returns:
+        dict: JSON-serialisable report
+    """
+    import networkx as nx
+
+    pes = sorted(pe for pe in pe_routers if pe in G)
+    roots = pes if spf_roots is None else sorted(root for root in spf_roots if root in G)
+    cache_file = None
+    if cache_dir:
+        key = topology_hash(G, 'analytics:' + ','.join(pes) + ':spf:' + ','.join(roots))
+        cache_file = os.path.join(cache_dir, f"{key}.json")
+        if os.path.exists(cache_file):
+            with open(cache_file) as f:
+                return json.load(f)
+
+    hops = pe_hop_counts(G, pes)
+    pair_paths, link_paths = ecmp_path_counts(G, pes)
+    spof = single_points_of_failure(G)
+    report = {
+        'routers': G.number_of_nodes(),
+        'links': G.number_of_edges(),
+        'pe_routers': pes,
+        'connected': nx.is_connected(G) if G.number_of_nodes() else True,
+        'pe_diameter': max((h for row in hops.values() for h in row.values()), default=0),
+        'pe_hop_counts': hops,
+        'articulation_points': spof['articulation_points'],
+        'bridges': [list(edge) for edge in spof['bridges']],
+        'pe_pair_ecmp_paths': [[a, b, count] for (a, b), count in sorted(pair_paths.items())],
+        'link_ecmp_paths': [[a, b, count] for (a, b), count in sorted(link_paths.items())],
+        'spf_trees': spf_trees(G, roots),
+    }
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_write(cache_file) as f:
+            json.dump(report, f)
+    return report
+
+
+def main(argv=None):
+    """
+    Analyse the SP core of an intent and write the report as JSON
+    """
+    parser = argparse.ArgumentParser(description="Analyse the SP core topology of an intent")
+    parser.add_argument("intent", nargs="?", default="intent.json", help="intent file")
+    parser.add_argument("--output", default="topology_report.json", help="report file to write")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write the report cache")
+    parser.add_argument("--spf-roots", nargs="+", metavar="ROUTER",
+                        help="routers whose SPF tree is reported (default: every PE)")
+    args = parser.parse_args(argv)
+
+    with open(args.intent) as f:
+        routers = json.load(f)['network']['service_provider']['routers']
+    G, _ = build_topology_graph(args.intent)
+    core = core_graph(G, routers['PE'] + routers['P'])
+    report = analyze_topology(core, routers['PE'], cache_dir=None if args.no_cache else ANALYTICS_CACHE_DIR,
+                              spf_roots=args.spf_roots)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"{report['routers']} routers, {report['links']} links, PE diameter {report['pe_diameter']} hops")
+    print(f"Articulation points: {', '.join(report['articulation_points']) or 'none'}")
+    print(f"Bridges: {', '.join('-'.join(edge) for edge in report['bridges']) or 'none'}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import ipaddress
+import json
+import sys
+from collections import defaultdict
+
+from intent_model import ROLES, parse_endpoint
+from templating import available_platforms
+
+
+def _pool_size(network, new_prefix):
+    """
+    Number of blocks IPAllocator can hand out from a network (same rules as PrefixPool)
+    """
+    if network.prefixlen > new_prefix:
+        return 0
+    if new_prefix == network.max_prefixlen:
+        if network.version == 6:
+            return network.num_addresses - 1 if network.num_addresses > 1 else network.num_addresses
+        return network.num_addresses - 2 if network.num_addresses > 2 else network.num_addresses
+    return 2 ** (new_prefix - network.prefixlen)
+
+
+def _pools_size(networks, new_prefix):
+    """
+    Number of blocks of a chain of prefixes
+    """
+    return sum(_pool_size(network, new_prefix) for network in networks)
+
+
+def _describe(networks):
+    return ", ".join(str(network) for network in networks)
+
+
+def _check_overlaps(prefixes, errors):
+    """
+    Report every pair of overlapping prefixes with one sort and one sweep
+
+    Args:
+        prefixes (list): (label, network) tuples, all of the same IP version
+    """
+    ordered = sorted(prefixes, key=lambda item: (int(item[1].network_address), item[1].prefixlen))
+    holder = None # prefix that reaches furthest so far
+    for label, network in ordered:
+        if holder is not None and int(network.network_address) <= int(holder[1].broadcast_address):
+            errors.append(f"{label}: prefix {network} overlaps {holder[0]} ({holder[1]})")
+        if holder is None or int(network.broadcast_address) > int(holder[1].broadcast_address):
+            holder = (label, network)
+
+
+def _is_name(value):
+    """
+    Router, interface, VRF or customer names must be non-empty strings
+    """
+    return isinstance(value, str) and value != ""
+
+
+def _is_asn(value):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value < 2 ** 32
+
+
+def _list_of(value, label, errors):
+    """
+    Return `value` if it is a list, otherwise report it and return an empty list
+    """
+    if isinstance(value, list):
+        return value
+    errors.append(f"{label}: expected a list, got {type(value).__name__}")
+    return []
+
+
+def validate_intent(intent):
+    """
+    Check a raw intent in a single pass and return every problem found.
+
+    Only dict and set lookups are used, so large intents are validated in
+    linear time (plus one sort of the prefixes). Malformed records (wrong
+    type, missing key) are reported as errors instead of raising.
+
+    Returns:
+        list: error messages, empty if the intent can be generated
+    """
+    errors = []
+    try:
+        network = intent['network']
+        sp = network['service_provider']
+    except (KeyError, TypeError) as e:
+        return [f"intent: missing required key {e}"]
+    # checked before sp is subscripted, a list or string would raise TypeError there
+    if not isinstance(sp, dict):
+        return ["service_provider: expected an object"]
+    try:
+        customers = network['customers']
+        ebgp_peers = intent['protocols']['bgp']['ebgp_peers']
+        pe_routers = sp['routers']['PE']
+        p_routers = sp['routers']['P']
+        links = sp['links']
+        sp_asn = sp['asn']
+    except (KeyError, TypeError) as e:
+        return [f"intent: missing required key {e}"]
+    customers = _list_of(customers, "network.customers", errors)
+    ebgp_peers = _list_of(ebgp_peers, "ebgp_peers", errors)
+    pe_routers = _list_of(pe_routers, "service_provider.routers.PE", errors)
+    p_routers = _list_of(p_routers, "service_provider.routers.P", errors)
+    links = _list_of(links, "service_provider.links", errors)
+    if not _is_asn(sp_asn):
+        errors.append(f"service_provider.asn: invalid ASN {sp_asn!r}")
+
+    # routers
+    sp_routers = set()
+    for role, routers in (("PE", pe_routers), ("P", p_routers)):
+        for router in routers:
+            if not _is_name(router):
+                errors.append(f"service_provider.routers.{role}: invalid router name {router!r}")
+            elif router in sp_routers:
+                errors.append(f"service_provider.routers: {router} is declared more than once")
+            else:
+                sp_routers.add(router)
+    pe_routers = [router for router in pe_routers if _is_name(router)]
+    valid_peers = [] # (index, peer) of the well-formed eBGP peers
+    ce_routers = set()
+    for i, peer in enumerate(ebgp_peers):
+        label = f"ebgp_peers[{i}]"
+        if not isinstance(peer, dict):
+            errors.append(f"{label}: expected an object, got {type(peer).__name__}")
+            continue
+        missing = [key for key in ('pe', 'ce', 'vrf', 'interface') if not _is_name(peer.get(key))]
+        if missing:
+            errors.append(f"{label}: missing or invalid {', '.join(repr(key) for key in missing)}")
+            continue
+        valid_peers.append((i, peer))
+        ce_routers.add(peer['ce'])
+        if peer['ce'] in sp_routers:
+            errors.append(f"{label}: CE {peer['ce']} is also declared as an SP router")
+
+    # customers, VRFs, route distinguishers and route targets
+    owner_of_vrf = {} # VRF -> name of the customer defining it
+    rd_owner = {}
+    rt_exporter = {}
+    valid_customers = [] # (name, customer) of the well-formed customers
+    for i, cust in enumerate(customers):
+        if not isinstance(cust, dict):
+            errors.append(f"customers[{i}]: expected an object, got {type(cust).__name__}")
+            continue
+        name = cust.get('name')
+        if not _is_name(name):
+            errors.append(f"customers[{i}]: missing or invalid 'name'")
+            name = f"customers[{i}]"
+        else:
+            valid_customers.append((name, cust))
+        asn = cust.get('asn')
+        if not _is_asn(asn):
+            errors.append(f"{name}: missing or invalid customer ASN {asn!r}")
+        elif asn == sp_asn:
+            errors.append(f"{name}: customer ASN {sp_asn} is the service provider ASN")
+        vrfs = cust.get('vrfs')
+        if not isinstance(vrfs, dict):
+            errors.append(f"{name}: 'vrfs' must be an object of VRF name -> {{rd, rt}}")
+            continue
+        for vrf, vrf_info in vrfs.items():
+            if vrf in owner_of_vrf:
+                errors.append(f"{name}: VRF {vrf} is already defined by {owner_of_vrf[vrf]}")
+                continue
+            owner_of_vrf[vrf] = name
+            if not isinstance(vrf_info, dict):
+                errors.append(f"{name}: VRF {vrf} must be an object with 'rd' and 'rt'")
+                continue
+            rd, rt = vrf_info.get('rd'), vrf_info.get('rt')
+            if not _is_name(rd):
+                errors.append(f"{name}: VRF {vrf} has a missing or invalid 'rd' {rd!r}")
+            elif rd in rd_owner:
+                errors.append(f"{name}: VRF {vrf} reuses RD {rd} of VRF {rd_owner[rd]}")
+            else:
+                rd_owner[rd] = vrf
+            if not _is_name(rt):
+                errors.append(f"{name}: VRF {vrf} has a missing or invalid 'rt' {rt!r}")
+            elif rt in rt_exporter:
+                errors.append(f"{name}: VRF {vrf} exports RT {rt} already exported by VRF {rt_exporter[rt]}")
+            else:
+                rt_exporter[rt] = vrf
+            import_rts = vrf_info.get('import_rts', [])
+            if not isinstance(import_rts, list) or not all(_is_name(rt) for rt in import_rts):
+                errors.append(f"{name}: VRF {vrf} 'import_rts' must be a list of route targets")
+
+    # prefixes: syntax, overlaps and pool sizes; a pool is a prefix or a list of prefixes
+    prefixes = {4: [], 6: []}
+    def networks_of(label, value, version=4):
+        networks, reported = [], len(errors)
+        for prefix in [value] if not isinstance(value, list) else value:
+            try:
+                network = ipaddress.ip_network(prefix)
+            except (ValueError, TypeError) as e:
+                errors.append(f"{label}: invalid prefix {prefix!r} ({e})")
+                continue
+            if network.version != version:
+                errors.append(f"{label}: {network} is not an IPv{version} prefix")
+                continue
+            prefixes[version].append((label, network))
+            networks.append(network)
+        if not networks and len(errors) == reported:
+            errors.append(f"{label}: no prefix given")
+        return networks
+    sp_base = networks_of("service_provider.base_prefix", sp.get('base_prefix'))
+    sp_loopback = networks_of("service_provider.loopback_prefix", sp.get('loopback_prefix'))
+    sp_base_v6 = sp_loopback_v6 = []
+    if ('base_prefix_v6' in sp) != ('loopback_prefix_v6' in sp):
+        errors.append("service_provider: base_prefix_v6 and loopback_prefix_v6 must be given together")
+    elif 'base_prefix_v6' in sp:
+        sp_base_v6 = networks_of("service_provider.base_prefix_v6", sp['base_prefix_v6'], version=6)
+        sp_loopback_v6 = networks_of("service_provider.loopback_prefix_v6", sp['loopback_prefix_v6'], version=6)
+    customer_pools = {}
+    for name, cust in valid_customers:
+        customer_pools[name] = (
+            networks_of(f"{name}.base_prefix", cust.get('base_prefix')),
+            networks_of(f"{name}.loopback_prefix", cust.get('loopback_prefix')),
+        )
+    for version in (4, 6):
+        _check_overlaps(prefixes[version], errors)
+
+    # links
+    seen_links = set()
+    core_links = {} # dict keys keep the link order in the report
+    interface_peer = {} # (router, interface) -> endpoint at the other end
+    ce_interface = {}
+    core_link_keys = set() # one entry per core link, parallel links included
+    def claim(router, intf, other, label):
+        previous = interface_peer.setdefault((router, intf), other)
+        if previous != other:
+            errors.append(f"{label}: interface {router}:{intf} is already connected to {previous}")
+    for i, link in enumerate(links):
+        label = f"links[{i}]"
+        try:
+            local_router, local_intf, local_is_ce = parse_endpoint(link['from'])
+            peer_router, peer_intf, peer_is_ce = parse_endpoint(link['to'])
+        except (KeyError, ValueError, AttributeError, TypeError):
+            errors.append(f"{label}: malformed link {link!r}")
+            continue
+        key = (link['from'], link['to'])
+        if key in seen_links:
+            errors.append(f"{label}: duplicate link {link['from']} -> {link['to']}")
+            continue
+        seen_links.add(key)
+        if local_is_ce or local_router not in sp_routers:
+            errors.append(f"{label}: 'from' endpoint {link['from']} is not a declared SP router")
+            continue
+        if peer_is_ce:
+            if peer_router not in ce_routers:
+                errors.append(f"{label}: CE {peer_router} has no eBGP peer entry")
+            claim(local_router, local_intf, link['to'], label)
+            claim(peer_router, peer_intf, link['from'], label)
+            ce_interface.setdefault(peer_router, (local_router, local_intf))
+            continue
+        if peer_router not in sp_routers:
+            errors.append(f"{label}: 'to' endpoint {link['to']} is not a declared router")
+            continue
+        if peer_router == local_router:
+            errors.append(f"{label}: link loops back to {local_router}")
+            continue
+        claim(local_router, local_intf, link['to'], label)
+        core_links[key] = None
+        core_link_keys.add(tuple(sorted(key)))
+    for local, peer in core_links:
+        if (peer, local) not in core_links:
+            errors.append(f"links: {local} -> {peer} has no reverse link {peer} -> {local}")
+
+    # eBGP peers
+    pe_set = set(pe_routers)
+    peers_of_ce = {}
+    ces_by_customer = defaultdict(int)
+    for i, peer in valid_peers:
+        label = f"ebgp_peers[{i}]"
+        pe, ce, vrf, intf = peer['pe'], peer['ce'], peer['vrf'], peer['interface']
+        if pe not in pe_set:
+            errors.append(f"{label}: {pe} is not a declared PE router")
+        if vrf not in owner_of_vrf:
+            errors.append(f"{label}: VRF {vrf} does not belong to any customer")
+        if ce in peers_of_ce:
+            errors.append(f"{label}: CE {ce} already peers through ebgp_peers[{peers_of_ce[ce]}]")
+            continue
+        peers_of_ce[ce] = i
+        if vrf in owner_of_vrf:
+            ces_by_customer[owner_of_vrf[vrf]] += 1
+        if ce not in ce_interface:
+            errors.append(f"{label}: CE {ce} has no 'CE:{ce}:<interface>' link")
+        elif ce_interface[ce] != (pe, intf):
+            errors.append(f"{label}: CE {ce} is linked to {ce_interface[ce][0]}:{ce_interface[ce][1]}, "
+                          f"not to {pe}:{intf}")
+        previous = interface_peer.get((pe, intf))
+        if previous is not None and not previous.startswith(f"CE:{ce}:"):
+            errors.append(f"{label}: interface {pe}:{intf} is already connected to {previous}")
+
+    # pool sizes: every core link, parallel ones included, gets its own subnet
+    def check_pool(label, networks, new_prefix, needed, what):
+        if networks and needed > _pools_size(networks, new_prefix):
+            unit = "addresses" if new_prefix == networks[0].max_prefixlen else f"/{new_prefix} subnets"
+            errors.append(f"{label}: {needed} {what} need more "
+                          f"than the {_pools_size(networks, new_prefix)} {unit} of {_describe(networks)}")
+    check_pool("service_provider.base_prefix", sp_base, 30, len(core_link_keys), "core links")
+    check_pool("service_provider.loopback_prefix", sp_loopback, 32, len(sp_routers), "SP routers")
+    check_pool("service_provider.base_prefix_v6", sp_base_v6, 127, len(core_link_keys), "core links")
+    check_pool("service_provider.loopback_prefix_v6", sp_loopback_v6, 128, len(sp_routers), "SP routers")
+    for name, (base, loopback) in customer_pools.items():
+        count = ces_by_customer[name]
+        check_pool(f"{name}.base_prefix", base, 30, count, "PE-CE links")
+        check_pool(f"{name}.loopback_prefix", loopback, 32, count, "CE routers")
+
+    # template sets by role
+    platforms = network.get('platforms', {})
+    if not isinstance(platforms, dict):
+        errors.append("network.platforms: expected an object of role -> template set")
+    elif platforms:
+        known = available_platforms()
+        for role, platform in platforms.items():
+            if role not in ROLES:
+                errors.append(f"network.platforms: unknown role {role!r} (expected one of {', '.join(ROLES)})")
+            elif platform not in known:
+                errors.append(f"network.platforms: no template set {platform!r} for {role} "
+                              f"(available: {', '.join(known) or 'none'})")
+
+    # route reflection
+    for rr in _list_of(sp.get('route_reflectors', []), "service_provider.route_reflectors", errors):
+        if not _is_name(rr) or rr not in pe_set:
+            errors.append(f"service_provider.route_reflectors: {rr} is not a declared PE router")
+    ibgp = sp.get('ibgp', {})
+    if not isinstance(ibgp, dict):
+        errors.append("service_provider.ibgp: expected an object")
+        return errors
+    mode = ibgp.get('mode', 'full_mesh')
+    if mode not in ('full_mesh', 'route_reflector'):
+        errors.append(f"service_provider.ibgp.mode: unknown mode {mode!r}")
+    if mode != 'route_reflector':
+        # reflector_count and clusters are only read in route_reflector mode
+        return errors
+    count = ibgp.get('reflector_count', 2)
+    if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+        errors.append(f"service_provider.ibgp.reflector_count: expected a positive integer, got {count!r}")
+    if ibgp.get('clusters'):
+        clustered = {} # PE -> label of its cluster
+        ids = {}
+        for i, cluster in enumerate(_list_of(ibgp['clusters'], "service_provider.ibgp.clusters", errors)):
+            label = f"service_provider.ibgp.clusters[{i}]"
+            if not isinstance(cluster, dict):
+                errors.append(f"{label}: expected an object with 'reflectors' and 'clients'")
+                continue
+            cluster_id = cluster.get('id', i + 1)
+            if not isinstance(cluster_id, (int, str)) or isinstance(cluster_id, bool):
+                errors.append(f"{label}.id: expected an integer or a dotted address, got {cluster_id!r}")
+            elif cluster_id in ids:
+                errors.append(f"{label}.id: cluster id {cluster_id} is already used by {ids[cluster_id]}")
+            else:
+                ids[cluster_id] = label
+            reflectors = _list_of(cluster.get('reflectors'), f"{label}.reflectors", errors)
+            clients = _list_of(cluster.get('clients'), f"{label}.clients", errors)
+            if not reflectors and isinstance(cluster.get('reflectors'), list):
+                errors.append(f"{label}.reflectors: a cluster needs at least one reflector")
+            for router in reflectors + clients:
+                if not _is_name(router) or router not in pe_set:
+                    errors.append(f"{label}: {router} is not a declared PE router")
+                elif router in clustered and clustered[router] != label:
+                    errors.append(f"{label}: PE {router} is already in {clustered[router]}")
+                elif router in clustered:
+                    errors.append(f"{label}: PE {router} is listed more than once "
+                                  f"(a router is either a reflector or a client)")
+                else:
+                    clustered[router] = label
+        for pe in pe_routers:
+            if pe not in clustered:
+                errors.append(f"service_provider.ibgp.clusters: PE {pe} is not in any cluster")
+
+    return errors
+
+
+def main(argv=None):
+    """
+    Validate an intent file and print every error found
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else "intent.json"
+    with open(path) as f:
+        errors = validate_intent(json.load(f))
+    for error in errors:
+        print(f"Error: {error}")
+    print(f"{path}: {len(errors)} error(s)" if errors else f"{path}: OK")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())